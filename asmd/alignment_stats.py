@@ -112,26 +112,8 @@ class Stats(object):
         Fills this object with data from `datasets`
         """
 
-        global process_
-
-        def process_(i, dataset):
-            try:
-                score, aligned = get_matching_scores(dataset, i)
-            except RuntimeError:
-                # skipping if we cannot match the notes for this score
-                return None
-
-            # computing diffs
-            ons_diffs = score[:, 1] - aligned[:, 1]
-            dur_ratios = (aligned[:, 2] - aligned[:, 1]) / (score[:, 2] -
-                                                            score[:, 1])
-            return ons_diffs, dur_ratios
-
         # puts in `self._data` onset and duration diffs
-        self._data = dataset.parallel(
-            process_,  # type: ignore
-            n_jobs=NJOBS,
-            backend="multiprocessing")
+        self._data = dataset.parallel(_fill_stats_song, n_jobs=NJOBS)
 
         count = 0
         for res in self._data:
@@ -282,6 +264,19 @@ class HMMStats(Stats):
         return str(type(self))
 
 
+def _fill_stats_song(i, dataset):
+    try:
+        score, aligned = get_matching_scores(dataset, i)
+    except RuntimeError:
+        # skipping if we cannot match the notes for this score
+        return None
+
+    # computing diffs
+    ons_diffs = score[:, 1] - aligned[:, 1]
+    dur_ratios = (aligned[:, 2] - aligned[:, 1]) / (score[:, 2] - score[:, 1])
+    return ons_diffs, dur_ratios
+
+
 def get_matching_scores(dataset: Dataset,
                         i: int) -> Tuple[np.ndarray, np.ndarray]:
     """
@@ -326,6 +321,48 @@ def _get_random_value_from_hist(hist, k=1, max_value=None, hmm=False):
     return np.asarray([uniform(start[i], end[i]) for i in range(len(start))])
 
 
+def _evaluate_song(i: int, dataset: Dataset, stat: Stats):
+    # reset the stats for a new song
+    stat.new_song()
+
+    try:
+        # take the matching notes in the score
+        score, aligned = get_matching_scores(dataset, i)
+    except RuntimeError:
+        # skipping if cannot match notes
+        return -1, -1
+
+    # take random standardized differences
+    aligned_diff = stat.get_random_onset_diff(k=score.shape[0])
+    song_ons_diff = score[:, 1] - aligned[:, 1]
+    # computing meang and dev from the matching notes
+    mean = np.mean(song_ons_diff)
+    std = np.std(song_ons_diff)
+
+    # computing the estimated ons
+    ons = np.sort(aligned[:, 1] + aligned_diff * std + mean)
+
+    # computing estmated offs
+    dur_ratios = stat.get_random_duration_ratio(k=score.shape[0])
+    song_dur = (aligned[:, 2] - aligned[:, 1])
+    song_dur_ratio = song_dur / (score[:, 2] - score[:, 1])
+    # computing meang and dev from the matching notes
+    mean = np.mean(song_dur_ratio)
+    std = np.std(song_dur_ratio)
+
+    # computing the estimated offs
+    est_ratios = dur_ratios * std + mean
+    new_dur = song_dur / est_ratios
+    offs = ons + new_dur
+
+    fix_offsets(ons, offs, score[:, 0])
+
+    # DTW between score and affinely transformed new times
+    offs_dist = np.abs(offs - score[:, 2]).mean()
+    ons_dist = np.abs(ons - score[:, 1]).mean()
+    return ons_dist, offs_dist
+
+
 def evaluate(dataset: Dataset, stats: List[Stats]):
     """
     Computes classical DTW over all datasets and returns avarage and standard
@@ -333,58 +370,12 @@ def evaluate(dataset: Dataset, stats: List[Stats]):
 
     This function will also need to install the dtw-python module separately
     """
-    global process_
-
-    def process_(i: int, dataset: Dataset, stat: Stats):
-
-        # reset the stats for a new song
-        stat.new_song()
-
-        try:
-            # take the matching notes in the score
-            score, aligned = get_matching_scores(dataset, i)
-        except RuntimeError:
-            # skipping if cannot match notes
-            return -1, -1
-
-        # take random standardized differences
-        aligned_diff = stat.get_random_onset_diff(k=score.shape[0])
-        song_ons_diff = score[:, 1] - aligned[:, 1]
-        # computing meang and dev from the matching notes
-        mean = np.mean(song_ons_diff)
-        std = np.std(song_ons_diff)
-
-        # computing the estimated ons
-        ons = np.sort(aligned[:, 1] + aligned_diff * std + mean)
-
-        # computing estmated offs
-        dur_ratios = stat.get_random_duration_ratio(k=score.shape[0])
-        song_dur = (aligned[:, 2] - aligned[:, 1])
-        song_dur_ratio = song_dur / (score[:, 2] - score[:, 1])
-        # computing meang and dev from the matching notes
-        mean = np.mean(song_dur_ratio)
-        std = np.std(song_dur_ratio)
-
-        # computing the estimated offs
-        est_ratios = dur_ratios * std + mean
-        new_dur = song_dur / est_ratios
-        offs = ons + new_dur
-
-        fix_offsets(ons, offs, score[:, 0])
-
-        # DTW between score and affinely transformed new times
-        offs_dist = np.abs(offs - score[:, 2]).mean()
-        ons_dist = np.abs(ons - score[:, 1]).mean()
-        return ons_dist, offs_dist
-
     for stat in stats:
         print(f"Evaluating {stat}")
-        distances = dataset.parallel(
-            process_,  # type: ignore
-            stat,
-            n_jobs=NJOBS,
-            max_nbytes=None,
-            backend="multiprocessing")
+        distances = dataset.parallel(_evaluate_song,
+                                     stat,
+                                     n_jobs=NJOBS,
+                                     max_nbytes=None)
         # removing scores where we couldn't match notes
         distances = np.asarray(distances)
         valid_scores = np.count_nonzero(distances[:, 0] > 0)
@@ -455,6 +446,8 @@ if __name__ == '__main__':
     dataset = _get_dataset()
     print("Computing statistics")
     stats = Stats()
+    # the same processes are used by all the splits
+    pool = dataset.set_pool(NJOBS)
     trainset, testset = choice(dataset,
                                p=[0.7, 0.3],
                                random_state=stats.seed())
@@ -467,3 +460,4 @@ if __name__ == '__main__':
         evaluate(testset, [
             model,
         ])
+    pool.close()
@@ -40,9 +40,7 @@ def modify_maestro_definifion(index: List[Tuple[Path, Path]]) -> Mapping:
         path = str((install_dir / song['recording']['path'][0]).with_suffix(''))
         if path in _index:
             song['groups'].append("asap")
-        del song['included']
 
-    del definition['included']
     return definition
 
 
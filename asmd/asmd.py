@@ -1,24 +1,69 @@
-import gzip
+import asyncio
+import functools
+import hashlib
 import inspect
 import json
+import math
 import os
+import pickle
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os.path import join as joinpath
-from typing import List, Optional
+from typing import List, MutableMapping, Optional
 
 import numpy as np
-from essentia.standard import MetadataReader, Resample
 import essentia as es
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
 from tqdm import tqdm
 
-from . import utils
-from .dataset_utils import chose_score_type, filter
+from . import gt_io, utils
+from .dataset_utils import (_DEFAULT_PATHS_OPTIONS, _SCORE_TYPES,
+                            SongSummary, SummaryIndex, _FilterIndex,
+                            _score_duration, _score_fields, _song_paths,
+                            chose_score_type, filter, get_score_mat)
 from .idiot import THISDIR
 
+try:
+    import cloudpickle
+except ImportError:
+    # vendored by older versions of joblib
+    from joblib.externals import cloudpickle
+
 # this only for detecting package directory but breaks readthedocs
 
 # THISDIR = './datasets/'
 
+#: directory where the compiled definitions are stored (see
+#: `compile_definitions`); if None, definitions are not stored on disk
+DEFINITIONS_INDEX_DIR = THISDIR
+
+#: directory used instead of `DEFINITIONS_INDEX_DIR`, `AUDIO_METADATA_DIR`
+#: and `SUMMARY_INDEX_DIR` when they are not writable (e.g. when the package
+#: is installed in a read-only location)
+USER_CACHE_DIR = joinpath(
+    os.environ.get('XDG_CACHE_HOME') or
+    joinpath(os.path.expanduser('~'), '.cache'), 'asmd')
+
+# change this when the structure of the compiled definitions changes
+_DEFINITIONS_INDEX_VERSION = 2
+
+#: directory where the tables of audio metadata are stored (see
+#: `Dataset.scan_audio_metadata`); if None, they are only kept in memory
+AUDIO_METADATA_DIR = THISDIR
+
+#: directory where the summaries of the songs are stored (see
+#: `Dataset.get_summary`); if None, they are only kept in memory
+SUMMARY_INDEX_DIR = THISDIR
+
+# the samples added on both sides of the excerpts resampled by
+# `Dataset.stream_audio`
+_RESAMPLING_MARGIN = 512
+
+#: maximum number of audio files of a song decoded at the same time by
+#: `Dataset.get_mix` and `Dataset.get_source`
+DECODING_THREADS = min(32, (os.cpu_count() or 1) + 4)
+
 
 class Dataset(object):
     def __init__(self,
@@ -51,14 +96,39 @@ class Dataset(object):
         -------
         * AudioScoreDataset :
             instance of the class
+
+        Note
+        ----
+
+        Definitions are loaded from a compiled index (see
+        `compile_definitions`) and are only unpickled when the field
+        `datasets` is first accessed.
         """
 
-        self.datasets = []
+        datasets_blobs = []
+        paths_blobs = []
+        chunks = {}
+        n_songs = 0
         if not empty:
             if len(definitions) == 0:
                 definitions = [joinpath(THISDIR, 'definitions/')]
             for path in definitions:
-                self.datasets += load_definitions(path)
+                index = compile_definitions(path)
+                datasets_blobs.append(index['datasets'])
+                paths_blobs.append(index['paths'])
+                for name, (start, end) in index['chunks'].items():
+                    chunks[name] = [start + n_songs, end + n_songs]
+                n_songs += index['n_songs']
+        self._definitions = _Definitions(datasets_blobs, paths_blobs, chunks,
+                                         n_songs)
+        # inclusion state: one bool per song in the definitions, in the same
+        # order as they appear in `datasets`
+        self._mask = np.ones(n_songs, dtype=bool)
+        # the arguments of the last `filter` that affect `paths`
+        self._paths_options = dict(_DEFAULT_PATHS_OPTIONS)
+        # `paths` and `_chunks` are created from `_mask` when needed
+        self._paths = None
+        self._chunks_value = None
 
         # opening medataset json file
         self.metadataset = json.load(open(metadataset_path, 'rt'))
@@ -68,21 +138,125 @@ class Dataset(object):
             self.install_dir = self.install_dir[:-1]
 
         # self.decompress_path = self.metadataset['decompress_path']
-        self.paths = []
-        self._chunks = {}
-
-        # let's include all the songs and datasets
-        for d in self.datasets:
-            d['included'] = True
-            for s in d['songs']:
-                s['included'] = True
-        # populate `paths`
-        filter(self)
+        self.audio_metadata = utils.AudioMetadata(
+            _install_index_path(AUDIO_METADATA_DIR, '_audio_metadata_',
+                                self.install_dir))
+        self.summary_index = SummaryIndex(
+            _install_index_path(SUMMARY_INDEX_DIR, '_summary_',
+                                self.install_dir))
+        self.gts_cache = None
+        self.score_mat_cache = None
+        self.audio_cache = None
+        self.pool = None
+        self.async_loader = None
 
     def __len__(self):
-        return len(self.paths)
+        if self._paths is None:
+            return int(np.count_nonzero(self._mask))
+        return len(self._paths)
+
+    @property
+    def datasets(self):
+        """
+        The list of definitions loaded, each one is a dictionary as described
+        in :doc:`JSON`. Definitions are shared among views (see `view`) and
+        should not be modified.
+        """
+        return self._definitions.get()
+
+    @datasets.setter
+    def datasets(self, value):
+        self._definitions = _Definitions.from_list(value)
+        self._mask = np.ones(self._definitions.n_songs, dtype=bool)
+        self._paths_options = dict(_DEFAULT_PATHS_OPTIONS)
+        self._paths = None
+        self._chunks_value = None
+
+    def view(self):
+        """
+        Returns a new `Dataset` which shares the definitions and the caches
+        with this one, but has its own copy of `paths` and of the inclusion
+        state, so that it can be filtered independently.
+
+        This is much cheaper than `copy.deepcopy`.
+        """
+        out = object.__new__(type(self))
+        out.__dict__.update(self.__dict__)
+        out._mask = self._mask.copy()
+        out._paths_options = dict(self._paths_options)
+        if self._paths is not None:
+            out._paths = list(self._paths)
+            out._chunks_value = {
+                k: list(v)
+                for k, v in self._chunks_value.items()
+            }
+        return out
+
+    def _set_mask(self, mask, **paths_options):
+        """
+        Sets the inclusion state of the songs; `paths` will be re-created
+        using `paths_options` (see `filter`)
+        """
+        self._mask = mask
+        self._paths_options = dict(_DEFAULT_PATHS_OPTIONS)
+        self._paths_options.update(paths_options)
+        self._paths = None
+        self._chunks_value = None
 
-    def parallel(self, func, *args, **kwargs):
+    def _make_paths(self):
+        """
+        Creates `paths` and `_chunks` from the inclusion state
+        """
+        definitions = self._definitions
+        options = self._paths_options
+        if (definitions.paths_blobs or definitions.all_paths is not None) \
+                and options['mixed'] and not options['sources'] \
+                and self._mask.all():
+            # the paths stored in the compiled definitions
+            self._paths = list(definitions.get_all_paths())
+            self._chunks_value = {
+                k: list(v)
+                for k, v in definitions.chunks.items()
+            }
+            return
+
+        paths = []
+        chunks = {}
+        offsets = definitions.get_offsets()
+        for i, dataset in enumerate(self.datasets):
+            idx = np.flatnonzero(self._mask[offsets[i]:offsets[i + 1]])
+            if len(idx) == 0:
+                continue
+            start = len(paths)
+            songs = dataset['songs']
+            paths += [_song_paths(songs[j], **options) for j in idx]
+            chunks[dataset['name']] = [start, len(paths)]
+        self._paths = paths
+        self._chunks_value = chunks
+
+    @property
+    def paths(self):
+        """
+        The list of paths of the songs included in this dataset; see
+        `__init__`. It is created from the inclusion state when first needed.
+        """
+        if self._paths is None:
+            self._make_paths()
+        return self._paths
+
+    @paths.setter
+    def paths(self, value):
+        if self._paths is None:
+            self._make_paths()
+        self._paths = value
+
+    @property
+    def _chunks(self):
+        if self._paths is None:
+            self._make_paths()
+        return self._chunks_value
+
+    def parallel(self, func, *args, chunk_size=None, **kwargs):
         """
         Applies a function to all items in `paths` in parallel using
         `joblib.Parallel`.
@@ -106,11 +280,24 @@ class Dataset(object):
             ... d.parallel(myfunc, marco, n_jobs=8, pal=etto)
 
             `filter` and `chunks` shouldn't be used.
+        chunk_size : int or None
+            the number of songs processed by each task; if None, songs are
+            split in about 4 tasks per job
 
         Returns
         -------
         list:
             The list of objects returned by each `func`
+
+        Note
+        ----
+
+        Each task only receives a lightweight copy of this dataset, without
+        definitions and with the paths of its songs only; the indices passed
+        to `func` are the same as in this dataset.
+
+        If a `WorkerPool` is set (see `set_pool`), it is used instead of
+        `joblib.Parallel` and the `joblib` arguments are ignored.
         """
         joblib_args = [
             k for k, v in inspect.signature(Parallel).parameters.items()
@@ -120,21 +307,152 @@ class Dataset(object):
             for k in dict(kwargs) if k in joblib_args
         }
 
-        return Parallel(**joblib_dict)(delayed(func)(i, self, *args, **kwargs)
-                                       for i in tqdm(range(len(self.paths))))
+        n = len(self.paths)
+        if chunk_size is None:
+            if self.pool is not None:
+                n_jobs = self.pool.n_jobs
+            else:
+                n_jobs = effective_n_jobs(joblib_dict.get('n_jobs'))
+            chunk_size = -(-n // (4 * n_jobs))
+        chunk_size = max(1, chunk_size)
+        chunks = [(start, min(start + chunk_size, n))
+                  for start in range(0, n, chunk_size)]
+
+        if self.pool is not None:
+            results = self.pool.map_chunks(func, self, chunks, args, kwargs)
+            return sum(results, [])
+
+        results = Parallel(**joblib_dict)(
+            delayed(_parallel_chunk)(func, self._proxy(start, end), start,
+                                     end, args, kwargs)
+            for start, end in tqdm(chunks))
+        return sum(results, [])
+
+    def _proxy(self, start, end):
+        """
+        Returns a lightweight `Dataset` for the songs from `start` to `end`
+        (excluded), used for sending them to other processes: it has the same
+        length and indices as this dataset, but only the paths and the
+        definitions of those songs are available (see `_ChunkDefinitions`)
+        """
+        proxy = object.__new__(type(self))
+        proxy.__dict__.update(self.__getstate__())
+        proxy._definitions = self._definitions.chunk(self._mask, start, end)
+        proxy._paths = _ListChunk(start, self.paths[start:end],
+                                  len(self.paths))
+        proxy._chunks_value = {k: list(v) for k, v in self._chunks.items()}
+        return proxy
+
+    def set_pool(self, pool):
+        """
+        Sets the pool of processes used by `parallel`; the same pool is shared
+        with the views of this dataset (see `view`), so that successive calls
+        to `parallel` reuse the same warm processes.
+
+        Arguments
+        ---------
+        pool : `WorkerPool`, int or None
+            a `WorkerPool`, or the number of processes of a new `WorkerPool`
+            created for this dataset (as `n_jobs` in `joblib`); if None,
+            `joblib.Parallel` is used
+
+        Returns
+        -------
+        `WorkerPool` :
+            the pool; call its `close` method when it is not needed anymore
+        """
+        if isinstance(pool, int):
+            pool = WorkerPool(self, pool)
+        self.pool = pool
+        return pool
+
+    def __getstate__(self):
+        # pools cannot be sent to other processes
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['async_loader'] = None
+        return state
+
+    def set_async_workers(self, max_workers: int):
+        """
+        Sets the maximum number of files loaded at the same time by the
+        asynchronous methods (`aget_mix`, `aget_source`, `aget_gts`,
+        `aget_item`). The same limit is shared with the views of this dataset
+        (see `view`).
+        """
+        self.async_loader = AsyncLoader(max_workers)
+
+    def set_gts_cache(self, max_bytes: Optional[int]):
+        """
+        Enables a cache for the ground-truths loaded by `get_gts`, with a
+        least-recently-used eviction policy so that the cached ground-truths
+        take at most `max_bytes` bytes. If `max_bytes` is `None` or 0, the
+        cache is disabled.
+
+        The cache is available as ``self.gts_cache`` (see
+        ``asmd.utils.LRUCache``): use it for inspecting hits and misses and
+        for invalidating entries, which are keyed by the full path of the
+        ground-truth files. The whole ground-truth of each file is cached, and
+        the `fields` requested to `get_gts` are taken from it.
+
+        When the cache is enabled, `get_gts` returns read-only ground-truths,
+        shared among all the callers: copy them if you need to modify them.
+        """
+        if max_bytes:
+            self.gts_cache = utils.LRUCache(max_bytes)
+        else:
+            self.gts_cache = None
+
+    def set_score_mat_cache(self,
+                            max_bytes: Optional[int],
+                            path: Optional[str] = None):
+        """
+        Enables an on-disk cache for the matrices computed by
+        ``dataset_utils.get_score_mat``, stored in the directory `path` and
+        taking at most `max_bytes` bytes. If `max_bytes` is `None` or 0, the
+        cache is disabled.
+
+        Matrices are keyed by the ground-truth paths, their modification times
+        and the requested score type, so that they are recomputed when the
+        ground-truths change. The default `path` is ``.cache/score_mat``
+        inside the installation directory; the cache is available as
+        ``self.score_mat_cache`` (see ``asmd.utils.DiskCache``).
+        """
+        if max_bytes:
+            if path is None:
+                path = joinpath(self.install_dir, '.cache', 'score_mat')
+            self.score_mat_cache = utils.DiskCache(path, max_bytes)
+        else:
+            self.score_mat_cache = None
+
+    def set_audio_cache(self,
+                        max_bytes: Optional[int],
+                        path: Optional[str] = None):
+        """
+        Enables an on-disk cache for the decoded audio, stored in the
+        directory `path` as float32 ``.npy`` files and taking at most
+        `max_bytes` bytes. If `max_bytes` is `None` or 0, the cache is
+        disabled.
+
+        Recordings are keyed by path, modification time and sample rate; once
+        cached, `get_mix`, `get_source` and `get_audio` read them as
+        memory-mapped arrays without decoding. The default `path` is
+        ``.cache/audio`` inside the installation directory; the cache is
+        available as ``self.audio_cache`` (see ``asmd.utils.DiskCache``).
+        """
+        if max_bytes:
+            if path is None:
+                path = joinpath(self.install_dir, '.cache', 'audio')
+            self.audio_cache = utils.DiskCache(path, max_bytes)
+        else:
+            self.audio_cache = None
 
     def get_songs(self):
         """
         Returns a list of dict, each representing a song
         """
 
-        songs = []
-        for dataset in self.datasets:
-            if dataset['included']:
-                for song in dataset['songs']:
-                    if song['included']:
-                        songs.append(song)
-        return songs
+        return self._definitions.get_songs(self._mask)
 
     def idx_chunk_to_whole(self, name, idx):
         """
@@ -151,7 +469,7 @@ class Dataset(object):
         else:
             raise Exception('idx should be int or list of int!')
 
-    def get_mix(self, idx, sr=None):
+    def get_mix(self, idx, sr=None, start=None, end=None, out=None):
         """
         Returns the audio array of the mixed song
 
@@ -163,39 +481,223 @@ class Dataset(object):
             the sampling rate at which the audio will be returned
             (if needed, a resampling is performed). If `None`, no
             resampling is performed
+        start : float or None
+            the time (seconds) from which the audio is loaded; if `None`, the
+            beginning of the song
+        end : float or None
+            the time (seconds) until which the audio is loaded; if `None`, the
+            end of the song
+        out : numpy.ndarray or None
+            a float32 array in which the mix is written; it must be at least
+            as long as the mix. If `None`, a new array is allocated when
+            needed.
 
         Returns
         -------
         mix : numpy.ndarray
-            the audio waveform of the mixed song
+            the audio waveform of the mixed song (a view of the first samples
+            of `out`, if provided)
         int :
             The sampling rate of the audio array
-        """
-        recordings_fn = self.get_mix_paths(idx)
 
-        recordings = []
-        for recording_fn in recordings_fn:
-            audio, in_sr = utils.open_audio(
-                joinpath(self.install_dir, recording_fn))
-            recordings.append(audio)
+        Note
+        ----
 
-        if len(recordings) > 1:
-            L = max(len(rec) for rec in recordings)
-            mix = np.zeros(L, dtype=np.float32)
-            for rec in recordings:
-                mix[:rec.shape[0]] += rec
-            mix /= len(rec)
+        If the song has more than one recording, they are decoded
+        concurrently (see `DECODING_THREADS`) and averaged.
+
+        If the audio cache is enabled (see `set_audio_cache`), the returned
+        array can be a read-only `numpy.memmap`.
+        """
+        recordings, out_sr = _open_many(
+            [joinpath(self.install_dir, fn) for fn in self.get_mix_paths(idx)],
+            sr, self.audio_cache, start, end, self.audio_metadata)
+
+        if len(recordings) > 1 or out is not None:
+            mix = _mix_into(recordings, out)
+            if len(recordings) > 1:
+                mix /= len(recordings)
         else:
             mix = recordings[0]
 
-        if sr is not None:
-            resampler = Resample(inputSampleRate=in_sr, outputSampleRate=sr)
-            mix = resampler(mix)
-        else:
-            sr = in_sr
-        return mix, sr
+        return mix, out_sr
 
-    def get_gts(self, idx):
+    def stream_audio(self,
+                     idx,
+                     block_size,
+                     hop,
+                     sr=None,
+                     score_type=['misaligned'],
+                     segment=30.0):
+        """
+        Iterates over the mixed audio of a song in blocks, together with the
+        notes sounding in each block.
+
+        The audio is loaded in segments of about `segment` seconds (see
+        `get_mix`), so that the memory used does not depend on the duration of
+        the recording. Compressed recordings cannot be read from the middle
+        (see ``utils.can_seek``): unless the audio cache is enabled (see
+        `set_audio_cache`), their mix is decoded once at the beginning,
+        instead of decoding the audio before each segment again. If `sr` is
+        not the original sampling rate, each segment is resampled together
+        with a few samples around it, so that the blocks at its boundaries
+        have no edge effects.
+
+        Arguments
+        ---------
+        idx : int
+            the index of the wanted item
+        block_size : int
+            the number of samples in each block
+        hop : int
+            the number of samples between the starts of two consecutive blocks
+        sr : int or None
+            the sampling rate of the audio; if `None`, the original one
+        score_type : list of str
+            the notes used; see `chose_score_type`
+        segment : float
+            the duration of the audio loaded at once (seconds)
+
+        Returns
+        -------
+        generator :
+            yields tuples ``(block, notes)``, where `block` is a
+            numpy.ndarray with `block_size` samples (zero-padded at the end of
+            the song) and `notes` contains the rows of
+            ``dataset_utils.get_score_mat`` for the notes starting before the
+            end of the block and ending after its start
+        """
+        index = self.get_note_index(idx, score_type)
+        native_sr = self.get_audio_data(idx)[0][2]
+        if sr is None:
+            sr = native_sr
+        blocks_per_segment = max(1, int(segment * sr) // hop)
+        mix = None
+        if self.audio_cache is None and not all(
+                utils.can_seek(joinpath(self.install_dir, fn))
+                for fn in self.paths[idx][0]):
+            mix, _ = self.get_mix(idx, sr)
+
+        k = 0
+        while True:
+            first = k * hop
+            last = (k + blocks_per_segment - 1) * hop + block_size
+            if mix is not None:
+                audio = mix[first:last + 1]
+            elif sr == native_sr:
+                audio = self._get_mix_samples(idx, first, last + 1, sr)
+            else:
+                audio = self._resample_mix_samples(idx, first, last + 1,
+                                                   native_sr, sr)
+            for j in range(blocks_per_segment):
+                start = (k + j) * hop - first
+                if start >= len(audio):
+                    return
+                block = audio[start:start + block_size]
+                if len(block) < block_size:
+                    block = np.pad(block, (0, block_size - len(block)))
+
+                t0 = (k + j) * hop / sr
+                yield block, index.between(t0, t0 + block_size / sr)
+            k += blocks_per_segment
+
+    def _get_mix_samples(self, idx, first, last, sr):
+        """
+        Returns the samples from `first` to `last` (excluded) of the mix at
+        its original sampling rate `sr`
+        """
+        # times in the middle of the samples, so that they are converted back
+        # to `first` and `last` despite rounding errors
+        audio, _ = self.get_mix(idx, None, (first + 0.5) / sr,
+                                (last + 0.5) / sr)
+        return audio
+
+    def _resample_mix_samples(self, idx, first, last, native_sr, sr):
+        """
+        Returns the samples from `first` to `last` (excluded) of the mix
+        resampled from `native_sr` to `sr`; the excerpt is resampled with a
+        margin of `_RESAMPLING_MARGIN` samples on both sides, so that it has
+        no edge effects and its first sample is exactly at `first`
+        """
+        # the first sample read is a multiple of `step`, so that its position
+        # after resampling is an integer
+        gcd = math.gcd(native_sr, sr)
+        step = native_sr // gcd
+        native_first = max(0, first * native_sr // sr - _RESAMPLING_MARGIN)
+        native_first -= native_first % step
+        native_last = -(-last * native_sr // sr) + _RESAMPLING_MARGIN
+        audio = self._get_mix_samples(idx, native_first, native_last,
+                                      native_sr)
+        if len(audio) == 0:
+            return audio
+        audio = utils.resample(audio, native_sr, sr)
+        offset = first - native_first // step * (sr // gcd)
+        return audio[offset:offset + last - first]
+
+    def get_note_index(self, idx, score_type=['misaligned']):
+        """
+        Returns an index of the notes of a song for querying them by time
+
+        Arguments
+        ---------
+        idx : int
+            the index of the wanted item
+        score_type : list of str
+            the notes used; see `chose_score_type`
+
+        Returns
+        -------
+        asmd.utils.NoteIndex :
+            the index of the rows of ``dataset_utils.get_score_mat``
+
+        Note
+        ----
+
+        When querying the same song many times, build the index once with
+        this method instead of using `notes_in` and `notes_active_at`, which
+        load the notes at each call.
+        """
+        return utils.NoteIndex(get_score_mat(self, idx, score_type))
+
+    def notes_in(self, idx, t0, t1, score_type=['misaligned']):
+        """
+        Returns the notes of a song sounding between `t0` and `t1` (seconds),
+        i.e. starting before `t1` and ending after `t0`, as rows of
+        ``dataset_utils.get_score_mat``; see `get_note_index`
+        """
+        return self.get_note_index(idx, score_type).between(t0, t1)
+
+    def notes_active_at(self, idx, t, score_type=['misaligned']):
+        """
+        Returns the notes of a song sounding at time `t` (seconds), i.e.
+        starting not after `t` and ending after it, as rows of
+        ``dataset_utils.get_score_mat``; see `get_note_index`
+        """
+        return self.get_note_index(idx, score_type).active_at(t)
+
+    def notes_in_many(self, idx, windows, score_type=['misaligned']):
+        """
+        Returns the notes of a song sounding in each window, as `notes_in`
+        would do
+
+        Arguments
+        ---------
+        idx : int
+            the index of the wanted item
+        windows : numpy.ndarray
+            a (w x 2) array with the start and the end of each window
+            (seconds), e.g. frames or beats
+        score_type : list of str
+            the notes used; see `chose_score_type`
+
+        Returns
+        -------
+        list :
+            the w arrays of notes of each window
+        """
+        return self.get_note_index(idx, score_type).between_many(windows)
+
+    def get_gts(self, idx, fields=None):
         """
         Return the ground-truth of the wanted item
 
@@ -203,23 +705,50 @@ class Dataset(object):
         ---------
         idx : int
             the index of the wanted item
+        fields : list of str or None
+            the fields to load, e.g. ``['misaligned', 'instrument']`` or
+            ``['score/onsets']``; if `None`, all the fields are loaded. With
+            binary ground-truths and without cache, the other fields are not
+            even read (see ``asmd.gt_io.project``).
 
         Returns
         -------
         list :
             list of dictionary representing the ground truth of each single source
+
+        Note
+        ----
+
+        If a binary version of a ground-truth file is available (see
+        ``asmd.gt_io``), it is loaded instead of the ``.json.gz`` one; in that
+        case, the values are ``numpy.ndarray`` instead of lists.
+
+        If the cache is enabled (see `set_gts_cache`), the returned
+        ground-truths are read-only.
         """
 
+        if fields is not None:
+            fields = tuple(fields)
         gts = []
         gts_fn = self.get_gts_paths(idx)
         for gt_fn in gts_fn:
             input_fn = joinpath(self.install_dir, gt_fn)
 
-            gt = json.load(gzip.open(input_fn))
+            if self.gts_cache is None:
+                gt = gt_io.load(input_fn, fields)
+            else:
+                # the whole ground-truth is cached, so that all the
+                # projections share the same entry
+                gt = self.gts_cache.get(input_fn)
+                if gt is None:
+                    gt, nbytes = gt_io.freeze(gt_io.load(input_fn))
+                    self.gts_cache.put(input_fn, gt, nbytes)
+                if fields is not None:
+                    gt = gt_io.ReadOnlyDict(gt_io.project(gt, fields))
             gts.append(gt)
         return gts
 
-    def get_source(self, idx):
+    def get_source(self, idx, start=None, end=None, sources=None):
         """
         Returns the sources at the specified index
 
@@ -227,22 +756,32 @@ class Dataset(object):
         ---------
         idx : int
             the index of the wanted item
+        start, end : float or None
+            the time range (seconds) to load; see `get_mix`
+        sources : list of int or None
+            the indices of the sources to load; if `None`, all the sources are
+            loaded. The other sources are not decoded.
 
         Returns
         -------
         list :
-            a list of numpy.ndarray representing the audio of each source
+            a list of numpy.ndarray representing the audio of each source (of
+            each wanted source, in the order of the song, if `sources` is
+            not `None`)
         int :
             The sampling rate of the audio array
         """
         sources_fn = self.get_sources_paths(idx)
+        if sources is not None:
+            sources_fn = [
+                fn for i, fn in enumerate(sources_fn) if i in sources
+            ]
 
-        sources = []
-        sr = -1
-        for source_fn in sources_fn:
-            audio, sr = utils.open_audio(joinpath(self.install_dir, source_fn))
-            sources.append(audio)
-        return sources, sr
+        return _open_many([joinpath(self.install_dir, fn) for fn in sources_fn],
+                          cache=self.audio_cache,
+                          start=start,
+                          end=end,
+                          metadata=self.audio_metadata)
 
     def get_item(self, idx):
         """
@@ -267,12 +806,127 @@ class Dataset(object):
         gts = self.get_gts(idx)
         return mix, sources, gts
 
+    def _get_async_loader(self):
+        if self.async_loader is None:
+            self.async_loader = AsyncLoader()
+        return self.async_loader
+
+    async def aget_mix(self, idx, sr=None):
+        """
+        Asynchronous version of `get_mix`: the audio is decoded in a thread
+        without blocking the event loop (see `set_async_workers`)
+        """
+        return await self._get_async_loader().run(self.get_mix, idx, sr)
+
+    async def aget_source(self, idx, sources=None):
+        """
+        Asynchronous version of `get_source` (see `aget_mix`)
+        """
+        return await self._get_async_loader().run(self.get_source,
+                                                  idx,
+                                                  sources=sources)
+
+    async def aget_gts(self, idx, fields=None):
+        """
+        Asynchronous version of `get_gts` (see `aget_mix`)
+        """
+        return await self._get_async_loader().run(self.get_gts, idx, fields)
+
+    async def aget_item(self, idx):
+        """
+        Asynchronous version of `get_item`; mix, sources and ground-truths are
+        loaded concurrently (see `aget_mix`)
+        """
+        return tuple(await asyncio.gather(self.aget_mix(idx),
+                                          self.aget_source(idx),
+                                          self.aget_gts(idx)))
+
+    def iter_items(self,
+                   indices=None,
+                   fields=['mix', 'sources', 'gts'],
+                   prefetch=2,
+                   workers=1,
+                   processes=False,
+                   **kwargs):
+        """
+        Iterates over the items of this dataset, loading the next items in
+        background while the current one is used.
+
+        At most `prefetch` items are loaded in advance: when they are ready,
+        loading stops until the consumer asks for the next item. If the
+        iteration is stopped early, the pending items are cancelled.
+
+        Arguments
+        ---------
+        indices : iterable of int or None
+            The indices of the items, in the order in which they are yielded;
+            if None, all the items are used
+        fields : list of str
+            The fields to load for each item, among ``'mix'`` (see `get_mix`),
+            ``'sources'`` (see `get_source`), ``'gts'`` (see `get_gts`) and
+            ``'pianoroll'`` (see `get_pianoroll`)
+        prefetch : int
+            The maximum number of items loaded in advance
+        workers : int
+            The number of threads or processes loading the items; using more
+            workers than `prefetch` is useless
+        processes : bool
+            If True, items are loaded in processes instead of threads
+        kwargs :
+            Keyword arguments for the methods loading each field, as a dict
+            keyed by field name; e.g. ``mix={'sr': 22050}``
+
+        Returns
+        -------
+        generator :
+            yields tuples ``(idx, item)`` where `item` is a dict containing
+            the output of the method of each field, keyed by field name
+        """
+        for field in fields:
+            if field not in _ITEM_FIELDS:
+                raise ValueError("Unknown field: " + str(field))
+        if indices is None:
+            indices = range(len(self))
+        indices = iter(indices)
+
+        if processes:
+            executor = ProcessPoolExecutor(workers)
+        else:
+            executor = ThreadPoolExecutor(workers)
+        pending = deque()
+
+        def submit():
+            for i in indices:
+                # processes receive a lightweight copy with this item only
+                dataset = self._proxy(i, i + 1) if processes else self
+                pending.append((i,
+                                executor.submit(_get_item_fields, dataset, i,
+                                                fields, kwargs)))
+                return True
+            return False
+
+        try:
+            for _ in range(max(1, prefetch)):
+                if not submit():
+                    break
+            while pending:
+                i, future = pending.popleft()
+                item = future.result()
+                submit()
+                yield i, item
+        finally:
+            for _i, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
     def get_pianoroll(self,
                       idx,
                       score_type=['misaligned'],
                       resolution=0.25,
                       onsets=False,
-                      velocity=True):
+                      velocity=True,
+                      dtype=np.float64,
+                      format='dense'):
         """
         Create pianoroll from list of pitches, onsets and offsets (in this order).
 
@@ -290,12 +944,20 @@ class Dataset(object):
         velocity : bool
             if True, values of each note is the velocity (except the first
             frame if `onsets` is used)
+        dtype : numpy.dtype
+            The type of the output values
+        format : str
+            ``'dense'``, ``'sparse'`` or ``'runs'``; see below
 
         Returns
         -------
         numpy.ndarray :
             A (128 x n) array where rows represent pitches and columns are time
             instants sampled with resolution provided as argument.
+        scipy.sparse.csr_matrix :
+            The same matrix in sparse form, if `format` is ``'sparse'``
+        utils.PianorollRuns :
+            The same matrix in run-length form, if `format` is ``'runs'``
 
         Note
         ----
@@ -307,34 +969,118 @@ class Dataset(object):
 
         In case your dataset does not start counting pitches from 0, you should
         correct the output of this function.
+
+        Where notes with the same pitch overlap, the value of the last note in
+        the ground-truth wins.
         """
 
-        gts = self.get_gts(idx)
+        gts = self.get_gts(idx, _score_fields(score_type))
         score_type = chose_score_type(score_type, gts)
+        runs = self._pianoroll_runs(gts, score_type, resolution, onsets,
+                                    velocity, dtype)
+        if format == 'runs':
+            return runs
+        elif format == 'sparse':
+            return utils.runs_to_sparse(runs)
+        elif format == 'dense':
+            return utils.runs_to_dense(runs)
+        else:
+            raise ValueError("Unknown pianoroll format: " + str(format))
+
+    def get_pianorolls(self,
+                       indices=None,
+                       score_type=['misaligned'],
+                       resolution=0.25,
+                       onsets=False,
+                       velocity=True,
+                       dtype=np.float64,
+                       out=None,
+                       **kwargs):
+        """
+        Create the pianorolls of multiple songs at once and store them in one
+        array, concatenated along the time axis. Notes are read in parallel
+        with `parallel` and each pianoroll is written directly into the
+        output array, without allocating one array per song.
 
-        # computing the maximum offset
-        max_offs = [max(gt[score_type]['offsets']) for gt in gts]
-        pianoroll = np.zeros((128, int(max(max_offs) / resolution) + 1))
+        Arguments
+        ---------
+        indices : list of int or None
+            The indices of the songs to retrieve; if None, all the songs are
+            used
+        score_type, resolution, onsets, velocity, dtype :
+            see `get_pianoroll`
+        out : str or None
+            If a path, the output is a memory-mapped ``.npy`` file created at
+            that path, otherwise it is kept in memory
+        kwargs :
+            passed to `parallel` (e.g. `n_jobs`)
 
-        # filling pianoroll
-        for gt in gts:
-            ons = gt[score_type]['onsets']
-            offs = gt[score_type]['offsets']
-            pitches = gt[score_type]['pitches']
-            velocities = gt[score_type]['velocities']
-            if not velocities or not velocity:
-                velocities = [1] * len(pitches)
+        Returns
+        -------
+        numpy.ndarray :
+            A (128 x N) array, where N is the total number of columns
+        numpy.ndarray :
+            An array of `len(indices) + 1` offsets: the pianoroll of the k-th
+            song are the columns ``offsets[k]:offsets[k+1]``
+        """
+        if indices is None:
+            dataset = self
+        else:
+            dataset = self.view()
+            dataset.paths = [self.paths[i] for i in indices]
 
-            for i in range(len(pitches)):
-                p = int(pitches[i])
-                on = int(ons[i] / resolution)
-                off = int(offs[i] / resolution) + 1
+        all_runs = dataset.parallel(_pianoroll_runs_task, score_type,
+                                    resolution, onsets, velocity, dtype,
+                                    **kwargs)
 
-                pianoroll[p, on:off] = velocities[i]
-                if onsets:
-                    pianoroll[p, on] = -1
+        offsets = np.cumsum([0] + [runs.shape[1] for runs in all_runs])
+        shape = (128, int(offsets[-1]))
+        if out is None:
+            pianorolls = np.zeros(shape, dtype=dtype)
+        else:
+            # new files are filled with zeros
+            pianorolls = np.lib.format.open_memmap(out,
+                                                   mode='w+',
+                                                   dtype=dtype,
+                                                   shape=shape)
+        for k, runs in enumerate(all_runs):
+            utils.runs_to_dense(runs,
+                                out=pianorolls[:, offsets[k]:offsets[k + 1]])
+        return pianorolls, offsets
+
+    @staticmethod
+    def _pianoroll_runs(gts, score_type, resolution, onsets, velocity,
+                        dtype):
+        """
+        Computes the `utils.PianorollRuns` of the notes in `gts`
+        """
+        # computing the maximum offset
+        max_offs = [max(gt[score_type]['offsets']) for gt in gts]
+        n_cols = int(float(max(max_offs)) / resolution) + 1
 
-        return pianoroll
+        pitches, starts, ends, values = [], [], [], []
+        for gt in gts:
+            notes = gt[score_type]
+            n = len(notes['pitches'])
+            pitches.append(np.asarray(notes['pitches'], dtype=np.float64))
+            # same truncation as `int(time / resolution)`
+            starts.append(
+                np.asarray(notes['onsets'], dtype=np.float64) / resolution)
+            ends.append(
+                np.asarray(notes['offsets'], dtype=np.float64) / resolution)
+            if len(notes['velocities']) == 0 or not velocity:
+                values.append(np.ones(n))
+            else:
+                values.append(np.asarray(notes['velocities'], dtype=np.float64))
+
+        starts = np.maximum(np.concatenate(starts).astype(np.intp), 0)
+        return utils.pianoroll_runs(np.concatenate(pitches),
+                                    starts,
+                                    np.concatenate(ends).astype(np.intp) + 1,
+                                    np.concatenate(values),
+                                    n_cols,
+                                    onsets=onsets,
+                                    dtype=dtype)
 
     def get_beats(self, idx):
         """
@@ -351,7 +1097,7 @@ class Dataset(object):
         numpy.ndarray :
             each row contains beat positions of each ground truth
         """
-        gts = self.get_gts(idx)
+        gts = self.get_gts(idx, ['score/beats'])
         beats = []
         for gt in gts:
             beats.append(gt['score']['beats'])
@@ -362,24 +1108,64 @@ class Dataset(object):
         """
         Returns the duration of the most aligned score available for a specific
         item
+
+        The duration is read from the summary of the songs, if available (see
+        `get_summary`), without loading the ground-truth.
         """
-        gts = self.get_gts(idx)
-        score_type = chose_score_type(
-            ['precise_alignment', 'broad_alignment', 'misaligned', 'score'],
-            gts)
+        summary = self.summary_index.get(self, idx)
+        if summary is not None:
+            return summary[0]
+        return _score_duration(self.get_gts(idx, _SCORE_TYPES))
 
-        gts_m = 0
-        for gt in gts:
-            gt_m = max(gt[score_type]['offsets'])
-            if gt_m > gts_m:
-                gts_m = gt_m
-        return gts_m
+    def get_summary(self, **kwargs) -> SongSummary:
+        """
+        Returns a summary of each song of this dataset: durations, number of
+        notes, pitch range, polyphony and availability of pedaling and f0
+        (see ``dataset_utils.SummaryIndex``).
+
+        The summary is computed once with `parallel` (`kwargs` are passed to
+        it) and stored in `SUMMARY_INDEX_DIR`, one for each `install_dir`;
+        only the songs whose ground-truth files changed are computed again.
+
+        Returns
+        -------
+        dataset_utils.SongSummary :
+            an object whose fields are arrays with one value per song, which
+            can be used to select songs with vectorized predicates
+        """
+        return SongSummary(self, self.summary_index.get_table(self, **kwargs))
+
+    def scan_audio_metadata(self, n_threads=8):
+        """
+        Probes the metadata of all the recordings and sources of the songs in
+        this dataset which are not up-to-date in ``self.audio_metadata`` and
+        stores them on disk (see ``asmd.utils.AudioMetadata``).
+
+        The table is kept in `AUDIO_METADATA_DIR`, one for each
+        `install_dir`, and it is used by `get_audio_data` and by the methods
+        loading audio; files which are not in the table are probed when
+        needed, so scanning is not required but avoids probing files one at a
+        time later.
+
+        Arguments
+        ---------
+        n_threads : int
+            the number of files probed at the same time
+        """
+        filenames = []
+        for song in self.get_songs():
+            filenames += song['recording']['path']
+            if 'sources' in song:
+                filenames += song['sources']['path']
+        self.audio_metadata.scan(
+            [joinpath(self.install_dir, fn) for fn in filenames], n_threads)
 
     def get_audio_data(self, idx):
         """
         Returns audio data of a specific item without loading the full audio.
 
-        N.B. see essentia.standard.MetadataReader!
+        N.B. see essentia.standard.MetadataReader! Values are read from
+        ``self.audio_metadata`` (see `scan_audio_metadata`).
 
         Returns
         -------
@@ -397,16 +1183,12 @@ class Dataset(object):
             number of channels
         """
         recordings_fn = self.paths[idx][0]
+        return [
+            self.audio_metadata.get(joinpath(self.install_dir, recording_fn))
+            for recording_fn in recordings_fn
+        ]
 
-        metadata = []
-        for recording_fn in recordings_fn:
-            recording_fn = joinpath(self.install_dir, recording_fn)
-            reader = MetadataReader(filename=str(recording_fn),
-                                    filterMetadata=True)
-            metadata.append(reader()[-4:])
-        return metadata
-
-    def get_audio(self, idx, sources=None):
+    def get_audio(self, idx, sources=None, start=None, end=None, out=None):
         """
         Get the mixed audio of certain sources or of the mix
 
@@ -417,7 +1199,13 @@ class Dataset(object):
         sources : list or None
             A list containing the indices of sources to be mixed and returned.
             If `None`, no sources will be mixed and the global mix will be
-            returned.
+            returned. Only the wanted sources are decoded; the mix is still
+            divided by the number of sources of the song and it is as long as
+            the longest wanted source.
+        start, end : float or None
+            the time range (seconds) to load; see `get_mix`
+        out : numpy.ndarray or None
+            a float32 array in which the audio is written; see `get_mix`
 
         Returns
         -------
@@ -428,15 +1216,14 @@ class Dataset(object):
         """
 
         if sources is not None:
-            audio, sr = self.get_source(idx)
-            L = max(len(au) for au in audio)
-            out = np.zeros(L, dtype=np.float32)
-            for i, au in enumerate(audio):
-                if i in sources:
-                    out[:au.shape[0]] += au
-            audio = out / len(audio)
+            # only the wanted sources are decoded, but the mix is still
+            # normalized by the number of sources of the song
+            n_sources = len(self.get_sources_paths(idx))
+            audio, sr = self.get_source(idx, start, end, sources=sources)
+            audio = _mix_into(audio, out)
+            audio /= n_sources
         else:
-            audio, sr = self.get_mix(idx)
+            audio, sr = self.get_mix(idx, start=start, end=end, out=out)
 
         return audio, sr
 
@@ -485,18 +1272,230 @@ class Dataset(object):
         `kind` can be 'extra' or 'missing'
 
         """
-        gts = self.get_gts(idx)
+        gts = self.get_gts(idx, [kind])
         out = []
         for gt in gts:
-            out.append(np.asarray(gt[kind], dtype=np.bool8))
+            out.append(np.array(gt[kind], dtype=np.bool8))
         return out
 
 
+def _open_many(paths,
+               sr=None,
+               cache=None,
+               start=None,
+               end=None,
+               metadata=None):
+    """
+    Decodes the audio files `paths` with `utils.open_audio`, concurrently if
+    they are more than one, and returns the list of arrays and the sampling
+    rate (-1 if `paths` is empty)
+    """
+    def load(path):
+        return utils.open_audio(path, sr, cache, start, end, metadata)
+
+    if len(paths) > 1:
+        loaded = list(_decoding_executor().map(load, paths))
+    else:
+        loaded = [load(path) for path in paths]
+    return [audio for audio, _ in loaded], loaded[-1][1] if loaded else -1
+
+
+_decoding_executors = {}
+
+
+def _install_index_path(directory, prefix, install_dir):
+    """
+    Returns the path of the file in `directory` storing an index of
+    `install_dir`, or None if `directory` is None; if `directory` is not
+    writable, `USER_CACHE_DIR` is used instead
+    """
+    if directory is None:
+        return None
+    if not os.access(directory, os.W_OK):
+        directory = USER_CACHE_DIR
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            return None
+    path_hash = hashlib.sha1(os.path.abspath(install_dir).encode()).hexdigest()
+    return joinpath(directory, prefix + path_hash[:16] + '.pkl')
+
+
+def _decoding_executor():
+    """
+    Returns the threads used by `_open_many`; essentia releases the GIL while
+    decoding. A new executor is created in forked processes.
+    """
+    pid = os.getpid()
+    if pid not in _decoding_executors:
+        _decoding_executors.clear()
+        _decoding_executors[pid] = ThreadPoolExecutor(DECODING_THREADS)
+    return _decoding_executors[pid]
+
+
+def _mix_into(arrays, out=None):
+    """
+    Sums `arrays` into the first samples of `out` (a new float32 array if
+    `None`) and returns them
+    """
+    L = max((len(a) for a in arrays), default=0)
+    if out is None:
+        out = np.zeros(L, dtype=np.float32)
+    else:
+        if len(out) < L:
+            raise ValueError(
+                "`out` has {} samples, but {} are needed".format(len(out), L))
+        out = out[:L]
+        out[:] = 0
+    for a in arrays:
+        out[:len(a)] += a
+    return out
+
+
+class _Definitions(object):
+    """
+    The definitions shared by a `Dataset` and its views; they are unpickled
+    from the compiled index when first needed, together with the `paths` of a
+    `Dataset` without any filter
+    """
+    def __init__(self, blobs, paths_blobs, chunks, n_songs):
+        self.blobs = blobs
+        self.datasets = []
+        self.paths_blobs = paths_blobs
+        self.all_paths = None
+        self.chunks = chunks
+        self.n_songs = n_songs
+        self.offsets = None
+        self.filter_index = None
+        # identifies these definitions in other processes
+        self.token = os.urandom(8).hex()
+
+    def __getstate__(self):
+        # the indexes are rebuilt when needed
+        state = self.__dict__.copy()
+        state['filter_index'] = None
+        return state
+
+    @classmethod
+    def from_list(cls, datasets):
+        """
+        Creates the object from a list of definitions
+        """
+        out = cls([], [], {}, sum(len(d['songs']) for d in datasets))
+        out.datasets = datasets
+        return out
+
+    def get(self):
+        """
+        Returns the list of definitions
+        """
+        if self.blobs:
+            for blob in self.blobs:
+                self.datasets += pickle.loads(blob)
+            self.blobs = []
+        return self.datasets
+
+    def get_all_paths(self):
+        """
+        Returns the `paths` of a `Dataset` without any filter
+        """
+        if self.paths_blobs:
+            self.all_paths = []
+            for blob in self.paths_blobs:
+                self.all_paths += pickle.loads(blob)
+            self.paths_blobs = []
+        return self.all_paths
+
+    def get_filter_index(self):
+        """
+        Returns the inverted indexes used by `filter`, building them on the
+        first call
+        """
+        if self.filter_index is None:
+            self.filter_index = _FilterIndex(self.get())
+        return self.filter_index
+
+    def get_offsets(self):
+        """
+        Returns an array containing the index of the first song of each
+        dataset in the global song index, plus the total number of songs
+        """
+        if self.offsets is None:
+            self.offsets = np.cumsum([0] +
+                                     [len(d['songs']) for d in self.get()])
+        return self.offsets
+
+    def get_songs(self, mask):
+        """
+        Returns the list of the songs included by `mask`
+        """
+        songs = []
+        offsets = self.get_offsets()
+        for i, dataset in enumerate(self.get()):
+            for j in np.flatnonzero(mask[offsets[i]:offsets[i + 1]]):
+                songs.append(dataset['songs'][j])
+        return songs
+
+    def chunk(self, mask, start, end):
+        """
+        Returns the `_ChunkDefinitions` of the songs from `start` to `end`
+        (excluded) among those included by `mask`
+        """
+        datasets = []
+        songs = []
+        n = 0
+        offsets = self.get_offsets()
+        for i, dataset in enumerate(self.get()):
+            idx = np.flatnonzero(mask[offsets[i]:offsets[i + 1]])
+            selected = idx[max(start - n, 0):max(end - n, 0)]
+            n += len(idx)
+            if len(selected) > 0:
+                dataset = dict(dataset)
+                dataset['songs'] = [dataset['songs'][j] for j in selected]
+                datasets.append(dataset)
+                songs += dataset['songs']
+        return _ChunkDefinitions(self.token, datasets,
+                                 _ListChunk(start, songs, n))
+
+
+class _ChunkDefinitions(object):
+    """
+    The definitions in the lightweight copies of a `Dataset` sent to other
+    processes (see `Dataset._proxy`): `datasets` only contains the songs of
+    the copy, and `songs` is returned by `Dataset.get_songs`. The other
+    operations on the definitions (e.g. filtering) raise an error.
+    """
+    def __init__(self, token, datasets, songs):
+        self.token = token
+        self.datasets = datasets
+        self.songs = songs
+
+    def get(self):
+        return self.datasets
+
+    def get_songs(self, mask):
+        return self.songs
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        raise RuntimeError(
+            "Only the definitions of the songs of the task are available in "
+            "the tasks of `Dataset.parallel`")
+
+
 def load_definitions(path):
     """
     Given a `path` to a directory, returns a list of dictionaries containing
     the definitions found in that directory (not recursive search)
     """
+    return pickle.loads(compile_definitions(path)['datasets'])
+
+
+def _parse_definitions(path):
+    """
+    Parses the `json` definitions in `path`
+    """
     datasets = []
     for file in os.listdir(path):
         fullpath = joinpath(path, file)
@@ -509,6 +1508,263 @@ def load_definitions(path):
     return datasets
 
 
+def _definitions_signature(path):
+    """
+    Returns name, size and modification time of each definition in `path`
+    """
+    signature = []
+    for file in os.listdir(path):
+        fullpath = joinpath(path, file)
+        if os.path.isfile(fullpath) and fullpath.endswith('.json'):
+            stat = os.stat(fullpath)
+            signature.append((file, stat.st_size, stat.st_mtime_ns))
+    return sorted(signature)
+
+
+def compile_definitions(path):
+    """
+    Returns the compiled index of the definitions in `path`, a dictionary
+    with keys:
+
+    * ``datasets``: the pickled list of definitions
+    * ``paths``: the pickled `paths` of a `Dataset` without any filter
+    * ``chunks``: the chunks of a `Dataset` without any filter
+    * ``n_songs``: the number of songs
+
+    The index is stored in `DEFINITIONS_INDEX_DIR` (or in `USER_CACHE_DIR`
+    if it is not writable) and is rebuilt when any definition file in `path`
+    is added, removed or modified.
+    """
+    signature = _definitions_signature(path)
+    index_fn = _install_index_path(DEFINITIONS_INDEX_DIR, '_definitions_',
+                                   path)
+    if index_fn is not None:
+        try:
+            with open(index_fn, 'rb') as f:
+                index = pickle.load(f)
+            if index['version'] == _DEFINITIONS_INDEX_VERSION and index[
+                    'signature'] == signature:
+                return index
+        except Exception:
+            # missing, outdated or corrupted index
+            pass
+
+    datasets = _parse_definitions(path)
+    paths = []
+    chunks = {}
+    for d in datasets:
+        start = len(paths)
+        for song in d['songs']:
+            paths.append([song['recording']['path'], [], song['ground_truth']])
+        chunks[d['name']] = [start, len(paths)]
+
+    index = {
+        'version': _DEFINITIONS_INDEX_VERSION,
+        'signature': signature,
+        'datasets': pickle.dumps(datasets, protocol=pickle.HIGHEST_PROTOCOL),
+        'paths': pickle.dumps(paths, protocol=pickle.HIGHEST_PROTOCOL),
+        'chunks': chunks,
+        'n_songs': len(paths)
+    }
+    if index_fn is not None:
+        try:
+            # writing to a temporary file, so that concurrent processes never
+            # read an incomplete index
+            tmp_fn = index_fn + '.' + str(os.getpid())
+            with open(tmp_fn, 'wb') as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fn, index_fn)
+        except OSError:
+            # the index directory is not writable
+            pass
+    return index
+
+
+def _pianoroll_runs_task(i, dataset, score_type, resolution, onsets,
+                         velocity, dtype):
+    gts = dataset.get_gts(i, _score_fields(score_type))
+    return Dataset._pianoroll_runs(gts, chose_score_type(score_type, gts),
+                                   resolution, onsets, velocity, dtype)
+
+
+class _ListChunk(object):
+    """
+    A list of `length` items (paths or songs of a dataset), of which only
+    those from `start` to ``start + len(items)`` (excluded) are available;
+    accessing the others raises an error
+    """
+    def __init__(self, start, items, length):
+        self.start = start
+        self.items = items
+        self.length = length
+
+    def _index(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("Song index out of range")
+        if not self.start <= i < self.start + len(self.items):
+            raise RuntimeError("Song " + str(i) +
+                               " is not available in this task of "
+                               "`Dataset.parallel`")
+        return i - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [
+                self.items[self._index(j)]
+                for j in range(*i.indices(self.length))
+            ]
+        return self.items[self._index(i)]
+
+    def __iter__(self):
+        return (self[i] for i in range(self.length))
+
+    def __len__(self):
+        return self.length
+
+
+def _parallel_chunk(func, dataset, start, end, args, kwargs):
+    return [func(i, dataset, *args, **kwargs) for i in range(start, end)]
+
+
+class AsyncLoader(object):
+    """
+    Runs blocking functions in a pool of `max_workers` threads from
+    `asyncio` coroutines; used by the asynchronous methods of `Dataset`.
+
+    At most `max_workers` functions are submitted to the pool at the same
+    time, the others wait in the event loop: if they are cancelled while
+    waiting, they are never started. If a running function is cancelled,
+    its result is discarded when it finishes.
+    """
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers)
+        # semaphores are bound to their event loop
+        self._semaphores: MutableMapping = weakref.WeakKeyDictionary()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs ``func(*args, **kwargs)`` in the pool and returns its output
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(
+                self.max_workers)
+        async with semaphore:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        """
+        Stops the threads
+        """
+        self._executor.shutdown()
+
+
+# the methods used by `Dataset.iter_items` for each field
+_ITEM_FIELDS = {
+    'mix': 'get_mix',
+    'sources': 'get_source',
+    'gts': 'get_gts',
+    'pianoroll': 'get_pianoroll'
+}
+
+
+def _get_item_fields(dataset, idx, fields, kwargs):
+    return {
+        field: getattr(dataset, _ITEM_FIELDS[field])(idx,
+                                                     **kwargs.get(field, {}))
+        for field in fields
+    }
+
+
+class WorkerPool(object):
+    """
+    A pool of processes which can be reused by multiple calls to
+    `Dataset.parallel` (see `Dataset.set_pool`).
+
+    Each process is started once and receives the definitions of `dataset`,
+    so that they are available to the tasks of `dataset` and of its views.
+    Tasks contain the function, its arguments and a lightweight copy of the
+    dataset taken at each call (see `Dataset._proxy`), so that its current
+    `install_dir` and caches are used; in-memory caches are kept by each
+    process across tasks. Functions and arguments are serialized with
+    `cloudpickle`, as in `joblib`.
+
+    The pool can be used as a context manager, which closes it at exit.
+    """
+    def __init__(self, dataset: Dataset, n_jobs: int = -1):
+        self.n_jobs = effective_n_jobs(n_jobs)
+        self._executor = ProcessPoolExecutor(
+            self.n_jobs,
+            initializer=_init_worker,
+            initargs=(dataset._definitions, ))
+
+    def map_chunks(self, func, dataset, chunks, args=(), kwargs={}):
+        """
+        Calls ``func(i, dataset, *args, **kwargs)`` for each `i` in each
+        ``(start, end)`` range in `chunks` and returns one list of results
+        per chunk
+        """
+        payload = cloudpickle.dumps((func, args, kwargs))
+        futures = [
+            self._executor.submit(_run_worker_chunk, payload,
+                                  dataset._proxy(start, end), start, end)
+            for start, end in chunks
+        ]
+        return [future.result() for future in tqdm(futures)]
+
+    def close(self):
+        """
+        Stops the processes
+        """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# the definitions and the in-memory caches of this process, if it is a worker
+# of a `WorkerPool`
+_worker_definitions: Optional[_Definitions] = None
+_worker_caches: dict = {}
+
+
+def _init_worker(definitions):
+    global _worker_definitions
+    _worker_definitions = definitions
+
+
+def _worker_cache(name, cache):
+    """
+    Returns the object of this process equivalent to the `cache` received
+    with a task, so that its content is kept across tasks
+    """
+    if cache is None:
+        return None
+    key = (name, type(cache), getattr(cache, 'max_bytes', None),
+           getattr(cache, 'path', None))
+    return _worker_caches.setdefault(key, cache)
+
+
+def _run_worker_chunk(payload, dataset, start, end):
+    func, args, kwargs = cloudpickle.loads(payload)
+    if _worker_definitions is not None and \
+            dataset._definitions.token == _worker_definitions.token:
+        dataset._definitions = _worker_definitions
+    for name in ['gts_cache', 'audio_metadata', 'summary_index']:
+        setattr(dataset, name, _worker_cache(name, getattr(dataset, name)))
+    return _parallel_chunk(func, dataset, start, end, args, kwargs)
+
+
 def func_wrapper(func, path, *args, **kwargs):
     d = Dataset(empty=True)
     d.paths = [path]
@@ -1,4 +1,3 @@
-import gzip
 import json
 import multiprocessing as mp
 import os
@@ -13,6 +12,7 @@ from typing import Callable, List, Optional
 import numpy as np
 from pretty_midi.constants import INSTRUMENT_MAP
 
+from . import gt_io
 from .asmd import load_definitions
 from .convert_from_file import *
 from .convert_from_file import _sort_alignment, _sort_pedal
@@ -24,6 +24,13 @@ from .idiot import THISDIR
 PARALLEL = True
 # PARALLEL = False
 
+#: the format of the written ground-truths (e.g. ``'msgpack.zst'``, see
+#: ``asmd.gt_io.codec_of``); if None, the format is given by the extension of
+#: the paths in the definitions (compact gzipped json). The files of the same
+#: ground-truths in other formats are removed, so that the written ones are
+#: loaded
+GT_CODEC = None
+
 rng = np.random.default_rng(1002)
 
 
@@ -305,9 +312,12 @@ def conversion(arg):
             out['missing'] = missing.tolist()
             out['extra'] = extra.tolist()
 
+        if GT_CODEC is not None:
+            final_path = gt_io.codec_path(final_path, GT_CODEC)
         print("   saving " + final_path)
-        # pretty printing stolen from official docs
-        json.dump(out, gzip.open(final_path, 'wt'), sort_keys=True, indent=4)
+        gt_io.save(out, final_path)
+        # files written by previous runs would be loaded instead
+        gt_io.remove_other_formats(final_path)
 
         # starting debugger if something is wrong
         if check(out) > 0:
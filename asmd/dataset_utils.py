@@ -1,9 +1,11 @@
-from copy import deepcopy
+import os
+import pickle
+from os.path import join as joinpath
 
 import numpy as np
 from sklearn.utils import check_random_state
 
-from . import utils
+from . import gt_io, utils
 
 
 def choice(dataset, p=[0.6, 0.2, 0.2], random_state=None):
@@ -23,17 +25,13 @@ def choice(dataset, p=[0.6, 0.2, 0.2], random_state=None):
     splits = random_state.choice(np.arange(len(p)), p=p, size=(len(dataset), ))
 
     # creating output datasets
+    included = np.flatnonzero(dataset._mask)
     out = []
     for i in range(len(p)):
-        d = deepcopy(dataset)
-        d.paths = np.asarray(dataset.paths, dtype=object)[splits == i].tolist()
-
-        # excluding/including songs
-        for j, song in enumerate(d.get_songs()):
-            if splits[j] == i:
-                song['included'] = True
-            else:
-                song['included'] = False
+        d = dataset.view()
+        mask = np.zeros_like(dataset._mask)
+        mask[included[splits == i]] = True
+        d._set_mask(mask, **dataset._paths_options)
         out.append(d)
     return tuple(out)
 
@@ -75,6 +73,21 @@ def chose_score_type(score_type, gts):
     return score_type
 
 
+#: the score types, from the most to the least aligned
+_SCORE_TYPES = ['precise_alignment', 'broad_alignment', 'misaligned', 'score']
+
+
+def _score_fields(score_type):
+    """
+    Returns the ground-truth fields needed by `chose_score_type` for
+    `score_type`, for loading them with ``Dataset.get_gts``
+    """
+    if len(score_type) > 1:
+        # `score` is used when no other type is available
+        return [t for t in _SCORE_TYPES if t in score_type or t == 'score']
+    return list(score_type)
+
+
 def filter(dataset,
            instruments=[],
            ensemble=None,
@@ -93,11 +106,11 @@ def filter(dataset,
 
     For advanced usage:
 
-    So that a dataset can be filtered, it must have the following keys:
+    So that a dataset can be filtered, each definition in ``dataset.datasets``
+    must have the following keys:
 
     * songs
     * name
-    * included
 
     All the attributes are checked at the song level, except for:
 
@@ -106,9 +119,14 @@ def filter(dataset,
     * `ground_truth`: this is checked at group level (i.e. each subgroup can
       have different annotations)
 
-    Similarly, each song must have the key ``included`` and optionally the
-    other keys that you want to filter, as described by the arguments of
-    this function.
+    Similarly, each song can optionally have the keys that you want to
+    filter, as described by the arguments of this function. Songs are selected
+    through inverted indexes, built on the first call and shared among copies
+    (see `_FilterIndex`), so that the cost of a filter does not depend on the
+    number of songs in the definitions. The inclusion
+    state of each song is stored in the `Dataset` object as a boolean array
+    over all the songs in the definitions, which are shared among copies (see
+    ``Dataset.view``); `paths` is re-created from it when first accessed.
 
     Arguments
     ---------
@@ -149,8 +167,11 @@ def filter(dataset,
         key of the ground_truth dictionary and `level_of_truth` is an int
         ranging from 0 to 2 (0->False, 1->True (manual annotation),
         2->True(automatic annotation)).
-        If only part of a dataset contains a certain ground-truth type, you
-        should use the `group` attribute to only select those songs.
+        A list of `(needed_ground_truth_type, level_of_truth)` pairs is
+        accepted too, while a plain string in the list selects songs for which
+        that ground-truth type is available at any level (i.e. > 0).
+        Songs are kept if they belong to at least one group providing all the
+        requested ground-truths.
     copy : bool
         If True, a new Dataset object is returned, and the calling one is
         leaved untouched
@@ -161,126 +182,178 @@ def filter(dataset,
     If ``copy`` is True, return a new Dataset object.
     """
     if copy:
-        ret = deepcopy(dataset)
+        ret = dataset.view()
     else:
         ret = dataset
 
-    # let's remove everything and put only the wanted ones
-    ret.paths = []
+    index = ret._definitions.get_filter_index()
+    mask = ret._mask.copy()
 
+    # checking dataset-level filters
     datasets = [d.lower() for d in datasets]
-    end = 0
-    for mydataset in ret.datasets:
-        FLAG = True
-        if not mydataset['included']:
-            FLAG = False
-        if len(datasets) > 0:
-            if mydataset['name'].lower() in datasets:
-                FLAG = True
-            else:
-                FLAG = False
-
-        # checking dataset-level filters
-        if ensemble is not None:
-            if ensemble != mydataset['ensemble']:
-                FLAG = False
-
-        # adding groups if ground_truth is checked
-        groups_gt = set()
-        for gt, val in ground_truth:
-            for group, group_gt in mydataset['ground_truth']:
-                if group_gt[gt] == val:
-                    groups_gt.add(group)
-
-        if FLAG:
-            ret._chunks[mydataset['name']] = [end, end]
-            for song in mydataset['songs']:
-                FLAG = True
-                if not song['included']:
-                    FLAG = False
-
-                # checking song levels filters
-                if instruments:
-                    if instruments != song['instruments']:
-                        FLAG = False
-
-                if composer:
-                    if composer not in song['composer']:
-                        FLAG = False
-
-                if groups:
-                    for group in groups:
-                        if group not in song['groups']:
-                            FLAG = False
-                            break
-
-                # checking groups taken for group-level filtering
-                if groups_gt:
-                    if len(groups_gt.intersection(song['groups'])) == 0:
-                        FLAG = False
-
-                if FLAG:
-                    gts = song['ground_truth']
-                    source = []
-                    mix = []
-                    if sources and "sources" in song.keys():
-                        if all:
-                            source = song['sources']['path']
-                        else:
-                            # find the index of the instrument
-                            instrument = instruments[0]
-                            idx = song['instruments'].index(instrument)
-
-                            # take index of the target instrument
-                            source = song['sources']['path'][idx]
-                            gts = song['ground_truth'][idx]
-
-                    if mixed:
-                        mix = song['recording']['path']
-                    ret.paths.append([mix, source, gts])
-                    end += 1
-                else:
-                    song['included'] = False
-            ret._chunks[mydataset['name']][1] = end
-        else:
-            # exclude dataset and all its songs
-            mydataset['included'] = False
-            for song in mydataset['songs']:
-                song['included'] = False
-
-    _check_consistency(ret, fix=True)
-
+    for i, (start, end) in enumerate(index.ranges):
+        if len(datasets) > 0 and index.names[i] not in datasets:
+            mask[start:end] = False
+        elif ensemble is not None and ensemble != index.ensemble[i]:
+            mask[start:end] = False
+
+    # checking song levels filters
+    if instruments:
+        mask &= index.mask(index.instruments.get(tuple(instruments)))
+
+    if composer:
+        mask &= index.mask(*index.find_composer(composer))
+
+    for group in groups:
+        mask &= index.mask(index.groups.get(group))
+
+    # checking groups taken for group-level filtering
+    if ground_truth:
+        mask &= index.mask(*index.find_ground_truth(ground_truth))
+
+    # `paths` will be re-created from the new inclusion state
+    ret._set_mask(mask,
+                  mixed=mixed,
+                  sources=sources,
+                  all=all,
+                  instruments=instruments)
     return ret
 
 
-def _check_consistency(dataset, fix=False):
+class _FilterIndex(object):
+    """
+    Inverted indexes over the songs of a list of definitions, used by
+    `filter`. Each index maps a value to the sorted array of the indices of
+    the songs having that value, where songs are numbered as in
+    ``Dataset._mask``.
+
+    Fields
+    ------
+    names : list of str
+        the lower-case name of each dataset
+    ensemble : list of bool
+        the `ensemble` field of each dataset
+    ranges : list of tuple[int, int]
+        the first and the last + 1 song index of each dataset
+    instruments : dict[tuple, numpy.ndarray]
+        songs by instruments
+    composers : dict[str, numpy.ndarray]
+        songs by composer
+    groups : dict[str, numpy.ndarray]
+        songs by group, in any dataset
+    ground_truth : list of dict[str, dict[str, int]]
+        the `ground_truth` field of each dataset
     """
-    Checks that is a dataset is included, then at least one of its songs is
-    included and that if a dataset is excluded, then all of its songs are
-    excluded.
+    def __init__(self, datasets):
+        self.names = []
+        self.ensemble = []
+        self.ranges = []
+        self.ground_truth = []
+        instruments = {}
+        composers = {}
+        groups = {}
+        k = 0
+        for dataset in datasets:
+            self.names.append(dataset['name'].lower())
+            self.ensemble.append(dataset.get('ensemble'))
+            self.ground_truth.append(dataset.get('ground_truth', {}))
+            start = k
+            for song in dataset['songs']:
+                instruments.setdefault(tuple(song.get('instruments', [])),
+                                       []).append(k)
+                composers.setdefault(song.get('composer', ''), []).append(k)
+                for group in song.get('groups', []):
+                    groups.setdefault(group, []).append(k)
+                k += 1
+            self.ranges.append((start, k))
+        self.n_songs = k
+
+        def to_arrays(index):
+            return {
+                key: np.asarray(value, dtype=np.intp)
+                for key, value in index.items()
+            }
 
-    If `fix` is True, if fixes the dataset inclusion, otherwise raise a
-    `RuntimeError`
+        self.instruments = to_arrays(instruments)
+        self.composers = to_arrays(composers)
+        self.groups = to_arrays(groups)
+
+    def mask(self, *indices):
+        """
+        Returns a boolean array over all the songs which is True for the songs
+        in any of `indices`; None is considered as an empty array
+        """
+        out = np.zeros(self.n_songs, dtype=bool)
+        for idx in indices:
+            if idx is not None:
+                out[idx] = True
+        return out
+
+    def find_composer(self, composer):
+        """
+        Returns the arrays of the songs whose composer contains `composer`
+        """
+        return [
+            idx for key, idx in self.composers.items() if composer in key
+        ]
+
+    def find_ground_truth(self, ground_truth):
+        """
+        Returns the arrays of the songs belonging to a group which provides
+        all the ground-truths in `ground_truth` (see `filter`)
+        """
+        if isinstance(ground_truth, dict):
+            ground_truth = ground_truth.items()
+
+        def satisfies(group_gt):
+            for gt in ground_truth:
+                if isinstance(gt, str):
+                    if group_gt.get(gt, 0) <= 0:
+                        return False
+                elif group_gt.get(gt[0]) != gt[1]:
+                    return False
+            return True
+
+        out = []
+        for (start, end), dataset_gt in zip(self.ranges, self.ground_truth):
+            for group, group_gt in dataset_gt.items():
+                if group not in self.groups or not satisfies(group_gt):
+                    continue
+                # the songs of this group in this dataset
+                idx = self.groups[group]
+                out.append(idx[np.searchsorted(idx, start):np.
+                               searchsorted(idx, end)])
+        return out
+
+
+#: the `filter` arguments that affect the `paths` of a song
+_DEFAULT_PATHS_OPTIONS = dict(mixed=True, sources=False, all=False,
+                              instruments=[])
+
+
+def _song_paths(song, mixed=True, sources=False, all=False, instruments=[]):
+    """
+    Returns the entry of `Dataset.paths` for `song`, according to the
+    arguments of `filter`
     """
+    gts = song['ground_truth']
+    source = []
+    mix = []
+    if sources and "sources" in song.keys():
+        if all:
+            source = song['sources']['path']
+        else:
+            # find the index of the instrument
+            instrument = instruments[0]
+            idx = song['instruments'].index(instrument)
 
-    for d in dataset.datasets:
-        included_songs = [s['included'] for s in d['songs']]
-        if d['included']:
-            if not any(included_songs):
-                if fix:
-                    d['included'] = False
-                else:
-                    raise RuntimeError(
-                        f"{d['name']} is included but no song is included")
+            # take index of the target instrument
+            source = song['sources']['path'][idx]
+            gts = song['ground_truth'][idx]
 
-        else:
-            if any(included_songs):
-                if fix:
-                    d['included'] = True
-                else:
-                    raise RuntimeError(
-                        f"{d['name']} is excluded but at least one song is included"
-                    )
+    if mixed:
+        mix = song['recording']['path']
+    return [mix, source, gts]
 
 
 def get_score_mat(dataset, idx, score_type=['misaligned'], return_notes=''):
@@ -313,75 +386,105 @@ def get_score_mat(dataset, idx, score_type=['misaligned'], return_notes=''):
     numpy.ndarray :
         Another boolean array with True if the note is missing or extra (depending on
         ``return_notes``); only if ``return_notes == 'both'`` 
-    """
 
-    gts = dataset.get_gts(idx)
-    score_type = chose_score_type(score_type, gts)
+    Note
+    ----
+
+    The ground-truths are loaded once for both the score and the
+    missing/extra notes. If the on-disk cache is enabled (see
+    ``asmd.asmd.Dataset.set_score_mat_cache``), the matrix is loaded from
+    there when available.
+    """
 
-    # print("    Loading ground truth " + score_type)
-    mat = []
-    for i, gt in enumerate(gts):
-
-        # initilize each column
-        pitches = np.array(gt[score_type]['pitches'])
-
-        ons = np.array(gt[score_type]['onsets'])
-        if not len(ons):
-            ons = np.full_like(pitches, -255)
-
-        missing = len(pitches) - len(ons)
-        if missing < 0:
-            # add -255 to pitches
-            pitches = np.append(pitches, [-255] * -missing)
-        elif missing > 0:
-            # add -255 to ons
-            ons = np.append(ons, [-255] * missing)
-
-        offs = np.append(gt[score_type]['offsets'], [-255] * missing)
-        if not len(offs):
-            offs = np.full_like(ons, -255)
-
-        vel = np.append(gt[score_type]['velocities'], [-255] * missing)
-        if not len(vel):
-            vel = np.full_like(ons, -255)
-        missing = len(pitches) - len(vel)
-        if missing < 0:
-            # add -255 to pitches, ons and offs
-            pitches = np.append(pitches, [-255] * -missing)
-            ons = np.append(ons, [-255] * -missing)
-            offs = np.append(offs, [-255] * -missing)
-        elif missing > 0:
-            # add -255 to vel
-            vel = np.append(vel, [-255] * missing)
-
-        num = np.full_like(ons, i)
-        instr = np.full_like(ons, gt['instrument'])
-        gt_mat = np.array([pitches, ons, offs, vel, instr, num])
-        mat.append(gt_mat)
-
-    if len(mat) > 1:
-        # mat now contains one list per each ground-truth, concatenating
-        mat = np.concatenate(mat, axis=1)
+    fields = _score_fields(score_type) + _SCORE_MAT_FIELDS
+    cache = dataset.score_mat_cache
+    if cache is None:
+        mat = _score_mat(dataset.get_gts(idx, fields), score_type)
     else:
-        mat = np.array(mat[0])
-    # transposing: one row per note
-    mat = mat.T
-    # ordering by onset, pitch and offset (in this order)
-    ind = np.lexsort([mat[:, 2], mat[:, 0], mat[:, 1]])
+        key = _score_mat_key(dataset, idx, score_type)
+        mat = cache.get(key)
+        if mat is None:
+            mat = _score_mat(dataset.get_gts(idx, fields), score_type)
+            cache.put(key, mat)
 
     if return_notes:
         if return_notes == 'both':
-            query = ['missing', 'extra']
+            query = [_MISSING_COL, _EXTRA_COL]
+        elif return_notes == 'missing':
+            query = [_MISSING_COL]
         else:
-            query = [return_notes]
-        # computing missing/extra notes
-        returned_notes = []
-        for q in query:
-            missing_extra = dataset.get_missing_extra_notes(idx, q)
-            missing_extra = np.concatenate(missing_extra)
-            returned_notes.append(missing_extra[ind])
-        return tuple([mat[ind]] + returned_notes)
-    return mat[ind]
+            query = [_EXTRA_COL]
+        if np.any(mat[:, query] == -255):
+            raise ValueError(
+                "Missing/extra notes are not available for this score type")
+        return tuple([np.ascontiguousarray(mat[:, :6])] +
+                     [mat[:, col].astype(bool) for col in query])
+    return np.ascontiguousarray(mat[:, :6])
+
+
+# columns of `_score_mat` containing missing and extra notes
+_MISSING_COL = 6
+_EXTRA_COL = 7
+
+# columns of `_score_mat` filled from the notes of each track
+_NOTES_COLS = ['pitches', 'onsets', 'offsets', 'velocities']
+
+# the ground-truth fields used by `_score_mat`, besides the score
+_SCORE_MAT_FIELDS = ['instrument', 'missing', 'extra']
+
+
+def _score_mat(gts, score_type):
+    """
+    Returns the matrix of `get_score_mat` with two more columns containing
+    missing and extra notes as 0/1
+    """
+    score_type = chose_score_type(score_type, gts)
+
+    # the length of each track is its longest column
+    lengths = [
+        max(len(gt[score_type][key]) for key in _NOTES_COLS) for gt in gts
+    ]
+    mat = np.full((sum(lengths), 8), -255, dtype=np.float64)
+    start = 0
+    for i, (gt, n) in enumerate(zip(gts, lengths)):
+        end = start + n
+        for col, key in enumerate(_NOTES_COLS):
+            values = gt[score_type][key]
+            mat[start:start + len(values), col] = values
+        mat[start:end, 4] = gt['instrument']
+        mat[start:end, 5] = i
+        # missing and extra notes refer to a specific score type, otherwise
+        # they are left to -255
+        for col in [_MISSING_COL, _EXTRA_COL]:
+            values = gt.get('missing' if col == _MISSING_COL else 'extra', [])
+            if len(values) == n:
+                mat[start:end, col] = values
+        start = end
+
+    # ordering by onset, pitch and offset (in this order)
+    return mat[np.lexsort([mat[:, 2], mat[:, 0], mat[:, 1]])]
+
+
+def _score_mat_key(dataset, idx, score_type):
+    """
+    Returns the key of `get_score_mat` in ``dataset.score_mat_cache``
+    """
+    paths, mtimes = _gts_signature(dataset, idx)
+    return ('score_mat', paths, mtimes, tuple(score_type))
+
+
+def _gts_signature(dataset, idx):
+    """
+    Returns the paths of the ground-truth files loaded by ``get_gts(idx)``
+    and their modification times, as two tuples
+    """
+    paths = []
+    mtimes = []
+    for gt_fn in dataset.get_gts_paths(idx):
+        path = gt_io.resolve(joinpath(dataset.install_dir, gt_fn))
+        paths.append(path)
+        mtimes.append(os.stat(path).st_mtime_ns)
+    return tuple(paths), tuple(mtimes)
 
 
 def intersect(*datasets, **kwargs):
@@ -396,7 +499,7 @@ def intersect(*datasets, **kwargs):
     """
     assert len(datasets) > 0, "Cannot intersect no datasets"
     if len(datasets) == 1:
-        return deepcopy(datasets[0])
+        return datasets[0].view()
     out = datasets[0]
     for i in range(1, len(datasets)):
         out = _compare_dataset(_and_func, out, datasets[i], **kwargs)
@@ -415,7 +518,7 @@ def union(*datasets, **kwargs):
     """
     assert len(datasets) > 0, "Cannot unify no datasets"
     if len(datasets) == 1:
-        return deepcopy(datasets[0])
+        return datasets[0].view()
     out = datasets[0]
     for i in range(1, len(datasets)):
         out = _compare_dataset(_or_func, out, datasets[i], **kwargs)
@@ -427,31 +530,17 @@ def _compare_dataset(compare_func, dataset1, dataset2, **kwargs):
     Returns a new dataset where each song and dataset are included only if
     `compare_func` is True for each corresponding couplke of songs and datasets
     """
-    out = deepcopy(dataset1)
-    out.paths = []
-    for i, d1 in enumerate(dataset1.datasets):
-        d2 = dataset2.datasets[i]
-        if compare_func(d1['included'], d2['included']):
-            out.datasets[i]['included'] = True
-            for j, s1 in enumerate(d1['songs']):
-                s2 = d2['songs'][j]
-                if compare_func(s1['included'], s2['included']):
-                    out.datasets[i]['songs'][j]['included'] = True
-                else:
-                    out.datasets[i]['songs'][j]['included'] = False
-
-        else:
-            out.datasets[i]['included'] = False
+    assert dataset1._mask.shape == dataset2._mask.shape, \
+        "Datasets must have the same definitions"
+    out = dataset1.view()
+    out._set_mask(compare_func(dataset1._mask, dataset2._mask))
     # populate paths
     return filter(out, **kwargs)
 
 
-def _or_func(a, b):
-    return a or b
+_or_func = np.logical_or
 
-
-def _and_func(a, b):
-    return a and b
+_and_func = np.logical_and
 
 
 def complement(dataset, **kwargs):
@@ -463,21 +552,8 @@ def complement(dataset, **kwargs):
     all the sources. However, you can pass any argument to `filter`, e.g.
     the `sources` argument
     """
-    out = deepcopy(dataset)
-    out.paths = []
-    for i, d in enumerate(dataset.datasets):
-        include_dataset = False
-        for j, s in enumerate(d['songs']):
-            if s['included']:
-                out.datasets[i]['songs'][j]['included'] = False
-            else:
-                out.datasets[i]['songs'][j]['included'] = True
-                include_dataset = True
-        if include_dataset:
-            # some song has been included
-            out.datasets[i]['included'] = True
-        else:
-            out.datasets[i]['included'] = False
+    out = dataset.view()
+    out._set_mask(~dataset._mask)
 
     # populate paths
     return filter(out, **kwargs)
@@ -520,79 +596,452 @@ def get_pedaling_mat(dataset, idx, frame_based=False, winlen=0.046, hop=0.01):
 
         The output is sorted by time.
     """
-    pedaling = []
-    for gt in dataset.get_gts(idx):
-        # take all cc...
-        cc_track_pedaling = []
-        for pedal in ['sustain', 'sostenuto', 'soft']:
-            L = len(gt[pedal]['values'])
-            if pedal == 'sustain':
-                cc_track_pedaling += list(
-                    zip(gt[pedal]['times'], gt[pedal]['values'], [-1] * L,
-                        [-1] * L))
-            elif pedal == 'sostenuto':
-                cc_track_pedaling += list(
-                    zip(gt[pedal]['times'], [-1] * L, gt[pedal]['values'],
-                        [-1] * L))
-            elif pedal == 'soft':
-                cc_track_pedaling += list(
-                    zip(gt[pedal]['times'], [-1] * L, [-1] * L,
-                        gt[pedal]['values']))
-        # sort cc according to time...
-        cc_track_pedaling.sort(key=lambda row: row[0])
-        cc_track_pedaling = np.array(cc_track_pedaling)
+    fields = _PEDALS + _SCORE_TYPES if frame_based else _PEDALS
+    gts = dataset.get_gts(idx, fields)
+    if frame_based:
+        # the duration is computed once for all the tracks
+        n_frames = int(utils.nframes(_score_duration(gts), hop, winlen)) + 1
+        frames = np.arange(n_frames)
 
+    pedaling = []
+    for gt in gts:
         if not frame_based:
+            # take all cc and sort them according to time; a stable sort
+            # keeps the order of simultaneous cc
+            cc_track_pedaling = []
+            for col, pedal in enumerate(_PEDALS):
+                times = np.asarray(gt[pedal]['times'], dtype=np.float64)
+                cc = np.full((len(times), 4), -1, dtype=np.float64)
+                cc[:, 0] = times
+                cc[:, col + 1] = gt[pedal]['values']
+                cc_track_pedaling.append(cc)
+            cc_track_pedaling = np.concatenate(cc_track_pedaling)
+            if len(cc_track_pedaling) == 0:
+                # same as `np.array([])`
+                cc_track_pedaling = np.empty(0)
+            else:
+                cc_track_pedaling = cc_track_pedaling[np.argsort(
+                    cc_track_pedaling[:, 0], kind='stable')]
             pedaling.append(cc_track_pedaling)
         else:
             # construct the frame-based output
-            # compute the number of frames
-            dur = dataset.get_score_duration(idx)
-            n_frames = int(utils.nframes(dur, hop, winlen)) + 1
-
-            # set up initial matrix that will be output
             frame_track_pedaling = np.zeros((n_frames, 4), dtype=float)
             # doesn't work because shape suffers from precisions problems
             # frame_track_pedaling[:, 0] = np.arange(winlen / 2, hop *
             # n_frames + winlen / 2, hop)
-            frame_track_pedaling[:, 0] = np.arange(n_frames) * hop + winlen / 2
-
-            # fill the matrix
-            # rember the last value used for each column index:
-            last_values = {
-                1: {
-                    "time": 0,
-                    "value": 0
-                },
-                2: {
-                    "time": 0,
-                    "value": 0
-                },
-                3: {
-                    "time": 0,
-                    "value": 0
-                },
-            }
-            # parse the control changes
-            for cc in cc_track_pedaling:
-                # compute the frame relative to this cc
-                frame_idx = utils.time2frame(cc[0], hop, winlen)
-                # put all values from last cc to this one equal to the last
-                # value
-                type_of_cc = np.argmax(cc[1:]) + 1
-                frame_track_pedaling[
-                    last_values[type_of_cc]["time"]:frame_idx,
-                    type_of_cc] = last_values[type_of_cc]["value"]
-                # update the last value
-                last_values[type_of_cc]["time"] = frame_idx
-                last_values[type_of_cc]["value"] = cc[type_of_cc]
-
-            # put all values from last cc to the end equal to the last
-            # value
-            if len(cc_track_pedaling) > 0:
-                for type_of_cc in range(1, 4):
-                    frame_track_pedaling[
-                        last_values[type_of_cc]["time"]:,
-                        type_of_cc] = last_values[type_of_cc]["value"]
-            pedaling.append(np.array(frame_track_pedaling))
+            frame_track_pedaling[:, 0] = frames * hop + winlen / 2
+
+            # each frame takes the value of the last cc falling before or in
+            # it, or 0 if there is no such cc
+            for col, pedal in enumerate(_PEDALS):
+                times = np.asarray(gt[pedal]['times'], dtype=np.float64)
+                if len(times) == 0:
+                    continue
+                order = np.argsort(times, kind='stable')
+                # same as `utils.time2frame`, clipped to the first frame
+                cc_frames = np.maximum(
+                    np.round((times[order] - winlen / 2) / hop), 0)
+                last = np.searchsorted(cc_frames, frames, side='right') - 1
+                values = np.asarray(gt[pedal]['values'],
+                                    dtype=np.float64)[order]
+                frame_track_pedaling[:, col + 1] = np.where(
+                    last >= 0, values[last], 0)
+            pedaling.append(frame_track_pedaling)
     return pedaling
+
+
+#: pedaling types, in the order of the columns of `get_pedaling_mat`
+_PEDALS = ['sustain', 'sostenuto', 'soft']
+
+
+def _score_duration(gts):
+    """
+    Returns the duration of the most aligned score available in `gts`
+    """
+    score_type = chose_score_type(
+        ['precise_alignment', 'broad_alignment', 'misaligned', 'score'], gts)
+
+    gts_m = 0
+    for gt in gts:
+        gt_m = max(gt[score_type]['offsets'])
+        if gt_m > gts_m:
+            gts_m = gt_m
+    return gts_m
+
+
+class ExcerptSampler(object):
+    """
+    Draws random excerpts of `duration` seconds from the songs of a dataset,
+    returning the audio of the mix together with the notes in the excerpt.
+
+    Excerpts are drawn uniformly over the total duration of the songs, so
+    that longer songs are drawn more often; songs shorter than `duration` are
+    never drawn. If `stratify` is ``'dataset'`` or ``'group'``, a dataset (or
+    a group) is first drawn uniformly, and then an excerpt is drawn from its
+    songs; songs belonging to multiple groups are used in each of them.
+
+    The durations of the songs (see `Dataset.get_score_duration`) are read
+    from the summary of the dataset (see `Dataset.get_summary`) when the
+    sampler is created and clipped to the duration of the shortest recording
+    of each song (see `Dataset.get_audio_data`), so that drawing an excerpt
+    does not need to open any file and excerpts never start after the end of
+    the audio; they are available in the attribute ``durations`` and can be
+    passed to new samplers of the same dataset.
+
+    The notes of the songs are indexed (see `Dataset.get_note_index`) the
+    first time an excerpt is taken from them; the indexes are kept in a cache
+    of `max_index_bytes` bytes.
+
+    Arguments
+    ---------
+    dataset : asmd.asmd.Dataset
+        the dataset from which excerpts are drawn
+    duration : float
+        the duration of each excerpt (seconds)
+    score_type : list of str
+        the notes returned; see `chose_score_type`
+    sr : int or None
+        the sampling rate of the audio; if `None`, the original one
+    stratify : str or None
+        ``'dataset'``, ``'group'`` or None
+    random_state : int, numpy.random.RandomState or None
+        the random number generator, see `choice`
+    durations : numpy.ndarray or None
+        the duration of each song; if None, they are taken from
+        ``dataset.get_summary(**kwargs)`` and clipped to the duration of the
+        recordings
+    max_index_bytes : int
+        the maximum size of the cached note indexes
+    """
+    def __init__(self,
+                 dataset,
+                 duration,
+                 score_type=['misaligned'],
+                 sr=None,
+                 stratify=None,
+                 random_state=None,
+                 durations=None,
+                 max_index_bytes=2**28,
+                 **kwargs):
+        self.dataset = dataset
+        self.duration = duration
+        self.score_type = score_type
+        self.sr = sr
+        self.random_state = check_random_state(random_state)
+        self._indexes = utils.LRUCache(max_index_bytes)
+        if durations is None:
+            durations = np.minimum(dataset.get_summary(**kwargs)['duration'],
+                                   _audio_durations(dataset))
+        self.durations = np.asarray(durations, dtype=np.float64)
+
+        # the songs of each stratum
+        if stratify is None:
+            strata = [np.arange(len(dataset))]
+        elif stratify == 'dataset':
+            strata = [
+                np.arange(start, end)
+                for start, end in dataset._chunks.values() if end > start
+            ]
+        elif stratify == 'group':
+            groups = {}
+            for i, song in enumerate(dataset.get_songs()):
+                for group in song['groups']:
+                    groups.setdefault(group, []).append(i)
+            strata = [np.asarray(songs) for songs in groups.values()]
+        else:
+            raise ValueError("Unknown stratification: " + str(stratify))
+
+        # for each stratum, the songs that can be drawn and the cumulative
+        # sum of the available start times
+        available = np.maximum(self.durations - duration, 0)
+        self._strata = []
+        for songs in strata:
+            songs = songs[available[songs] > 0]
+            if len(songs) > 0:
+                self._strata.append((songs, np.cumsum(available[songs])))
+        if len(self._strata) == 0:
+            raise RuntimeError("No song is longer than the excerpt duration")
+
+    def sample(self):
+        """
+        Draws one excerpt and returns the index of the song and the start time
+        of the excerpt (seconds)
+        """
+        songs, cumulative = self._strata[self.random_state.randint(
+            len(self._strata))]
+        t = self.random_state.uniform(0, cumulative[-1])
+        k = min(np.searchsorted(cumulative, t, side='right'), len(songs) - 1)
+        start = t - (cumulative[k - 1] if k > 0 else 0)
+        return int(songs[k]), float(start)
+
+    def get_excerpt(self, idx, start):
+        """
+        Returns the excerpt of song `idx` starting at `start` (seconds)
+
+        Returns
+        -------
+        numpy.ndarray :
+            the audio of the mix, zero-padded to `duration` if the recording
+            ends before
+        int :
+            the sampling rate of the audio
+        numpy.ndarray :
+            the rows of `get_score_mat` for the notes sounding in the excerpt,
+            with times relative to `start` and clipped to the excerpt
+        """
+        end = start + self.duration
+        audio, sr = self.dataset.get_mix(idx, self.sr, start, end)
+        length = int(self.duration * sr)
+        if len(audio) < length:
+            audio = np.pad(audio, (0, length - len(audio)))
+        else:
+            audio = audio[:length]
+
+        notes = self.get_note_index(idx).between(start, end)
+        notes[:, 1:3] = np.clip(notes[:, 1:3] - start, 0, self.duration)
+        return audio, sr, notes
+
+    def __iter__(self):
+        """
+        Yields tuples ``(idx, start, audio, sr, notes)`` forever; see
+        `sample` and `get_excerpt`
+        """
+        while True:
+            idx, start = self.sample()
+            yield (idx, start) + self.get_excerpt(idx, start)
+
+    def get_note_index(self, idx):
+        """
+        Returns the index of the notes of song `idx`, building it if it is
+        not in the cache
+        """
+        index = self._indexes.get(idx)
+        if index is None:
+            index = self.dataset.get_note_index(idx, self.score_type)
+            self._indexes.put(idx, index, index.nbytes)
+        return index
+
+
+def _audio_durations(dataset):
+    """
+    Returns the duration of the shortest recording of each song in `dataset`,
+    probing the recordings which are not in ``dataset.audio_metadata``
+    """
+    dataset.audio_metadata.scan([
+        joinpath(dataset.install_dir, fn) for i in range(len(dataset))
+        for fn in dataset.paths[i][0]
+    ])
+    durations = [
+        min(data[0] for data in dataset.get_audio_data(i))
+        for i in range(len(dataset))
+    ]
+    return np.asarray(durations, dtype=np.float64)
+
+
+#: the columns of the table returned by `SummaryIndex.get_table`
+_SUMMARY_DTYPE = np.dtype([('duration', np.float64)] +
+                          [('duration_' + score_type, np.float64)
+                           for score_type in _SCORE_TYPES] +
+                          [('n_notes', np.int64), ('pitch_min', np.int16),
+                           ('pitch_max', np.int16), ('polyphony', np.int32),
+                           ('n_sources', np.int32), ('has_pedaling', bool),
+                           ('has_f0', bool)])
+
+
+class SummaryIndex(utils.PersistentTable):
+    """
+    A summary of each song of an installation, stored in the file `path` and
+    updated only for the songs whose ground-truth files changed (see
+    `Dataset.get_summary` and ``utils.PersistentTable``).
+
+    For each song, the summary contains:
+
+    * ``duration``: the duration of the most aligned score (see
+      `Dataset.get_score_duration`)
+    * ``duration_<score type>``: the duration of each score type, or NaN if
+      it is not available
+    * ``n_notes``, ``pitch_min``, ``pitch_max`` and ``polyphony``: the number
+      of notes, their lowest and highest pitch and the maximum number of
+      notes sounding at the same time in the most aligned score (-1 if there
+      are no notes)
+    * ``n_sources``: the number of ground-truth files
+    * ``has_pedaling`` and ``has_f0``: whether any control change of the
+      pedals or any f0 value is available
+    """
+    _VERSION = 1
+
+    def _encode(self, entries):
+        keys = list(entries.keys())
+        return {
+            'keys': keys,
+            'mtimes': [entries[key][0] for key in keys],
+            'table': np.array([entries[key][1] for key in keys],
+                              dtype=_SUMMARY_DTYPE)
+        }
+
+    def _decode(self, stored):
+        return {
+            key: (mtimes, tuple(row.item()))
+            for key, mtimes, row in zip(stored['keys'], stored['mtimes'],
+                                        stored['table'])
+        }
+
+    def get(self, dataset, idx):
+        """
+        Returns the summary of song `idx` of `dataset` as a tuple with the
+        fields of `get_table`, or None if it is not available or outdated
+        """
+        paths, mtimes = _gts_signature(dataset, idx)
+        with self._lock:
+            entry = self._get_entries().get(paths)
+        if entry is None or entry[0] != mtimes:
+            return None
+        return entry[1]
+
+    def update(self, dataset, **kwargs):
+        """
+        Computes the summary of the songs of `dataset` which are not available
+        or outdated, using ``dataset.parallel`` with `kwargs`, and saves it
+        """
+        signatures = [_gts_signature(dataset, i) for i in range(len(dataset))]
+        with self._lock:
+            entries = self._get_entries()
+            missing = [
+                i for i, (paths, mtimes) in enumerate(signatures)
+                if entries.get(paths, (None, ))[0] != mtimes
+            ]
+        if len(missing) == 0:
+            return
+
+        subset = dataset.view()
+        subset.paths = [dataset.paths[i] for i in missing]
+        rows = subset.parallel(_summary_task, **kwargs)
+        with self._lock:
+            entries = self._get_entries()
+            for i, row in zip(missing, rows):
+                paths, mtimes = signatures[i]
+                entries[paths] = (mtimes, row)
+            self._unsaved += len(missing)
+            self.save()
+
+    def get_table(self, dataset, **kwargs):
+        """
+        Returns a structured numpy array with one row for each song of
+        `dataset`, updating the summary if needed (see `update`)
+        """
+        self.update(dataset, **kwargs)
+        with self._lock:
+            entries = self._get_entries()
+            rows = [
+                entries[_gts_signature(dataset, i)[0]][1]
+                for i in range(len(dataset))
+            ]
+        return np.array(rows, dtype=_SUMMARY_DTYPE)
+
+
+class SongSummary(object):
+    """
+    The summary of the songs of a dataset, returned by
+    `Dataset.get_summary`; see `SummaryIndex` for the available fields.
+
+    Each field is a numpy array with one value per song, so that songs can be
+    selected with vectorized predicates, e.g.::
+
+        summary = dataset.get_summary()
+        mask = (summary['duration'] > 300) & (summary['n_notes'] > 5000)
+        long_songs = summary.select(mask)
+    """
+    def __init__(self, dataset, table):
+        self.dataset = dataset
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, field):
+        return self.table[field]
+
+    @property
+    def fields(self):
+        return list(self.table.dtype.names)
+
+    def indices(self, mask):
+        """
+        Returns the indices of the songs where the boolean array `mask` is
+        True
+        """
+        return np.flatnonzero(mask)
+
+    def select(self, mask):
+        """
+        Returns a view of the dataset (see `Dataset.view`) with only the songs
+        where the boolean array `mask` is True
+        """
+        included = np.flatnonzero(self.dataset._mask)
+        out = self.dataset.view()
+        new_mask = np.zeros_like(self.dataset._mask)
+        new_mask[included[np.asarray(mask, dtype=bool)]] = True
+        out._set_mask(new_mask, **self.dataset._paths_options)
+        return out
+
+
+# the ground-truth fields read by `_song_summary`
+_SUMMARY_FIELDS = [
+    score_type + gt_io.SEP + field for score_type in _SCORE_TYPES
+    for field in ['onsets', 'offsets', 'pitches']
+] + [pedal + gt_io.SEP + 'times' for pedal in _PEDALS]
+
+
+def _summary_task(i, dataset):
+    lengths = [
+        gt_io.field_lengths(joinpath(dataset.install_dir, gt_fn))
+        for gt_fn in dataset.get_gts_paths(i)
+    ]
+    if any(gt_lengths is None for gt_lengths in lengths):
+        # other formats are decoded entirely anyway
+        gts = dataset.get_gts(i)
+        has_f0 = any(len(gt.get('f0', [])) > 0 for gt in gts)
+    else:
+        # the f0 are not read, only their length in the header
+        gts = dataset.get_gts(i, _SUMMARY_FIELDS)
+        has_f0 = any(gt_lengths.get('f0', 0) > 0 for gt_lengths in lengths)
+    return _song_summary(gts, has_f0)
+
+
+def _song_summary(gts, has_f0):
+    """
+    Returns the row of `SummaryIndex` for the ground-truths `gts`; `has_f0`
+    tells whether any f0 value is available
+    """
+    durations = []
+    for score_type in _SCORE_TYPES:
+        offsets = [
+            np.max(gt[score_type]['offsets']) for gt in gts
+            if len(gt[score_type]['offsets']) > 0
+        ]
+        durations.append(float(max(offsets)) if offsets else np.nan)
+
+    score_type = chose_score_type(_SCORE_TYPES, gts)
+    pitches = np.concatenate(
+        [np.asarray(gt[score_type]['pitches'], dtype=np.float64) for gt in gts])
+    onsets = np.concatenate(
+        [np.asarray(gt[score_type]['onsets'], dtype=np.float64) for gt in gts])
+    offsets = np.concatenate(
+        [np.asarray(gt[score_type]['offsets'], dtype=np.float64) for gt in gts])
+    if len(pitches) > 0:
+        pitch_min, pitch_max = int(pitches.min()), int(pitches.max())
+        # +1 at each onset and -1 at each offset, with offsets before onsets
+        # at the same time
+        times = np.concatenate([onsets, offsets])
+        steps = np.concatenate([np.ones(len(onsets)), -np.ones(len(offsets))])
+        order = np.lexsort([steps, times])
+        polyphony = int(np.max(np.cumsum(steps[order])))
+    else:
+        pitch_min = pitch_max = polyphony = -1
+
+    has_pedaling = any(
+        len(gt[pedal]['times']) > 0 for gt in gts for pedal in _PEDALS
+        if pedal in gt)
+    return (float(_score_duration(gts)), ) + tuple(durations) + (
+        len(pitches), pitch_min, pitch_max, polyphony, len(gts), has_pedaling,
+        has_f0)
@@ -0,0 +1,172 @@
+"""
+Benchmark of the ground-truth formats (see ``asmd.gt_io``) on an
+installation: the ground-truths of some songs are written in each format to a
+temporary directory, then the size on disk and the time for loading them are
+compared with the files currently installed.
+
+Use this module as a script:
+
+>>> python -m asmd.gt_benchmark -n 50 -d Bach10 PHENICX
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from os.path import join as joinpath
+
+from sklearn.utils import check_random_state
+
+from . import gt_io
+
+#: the formats compared by default; formats whose packages are not installed
+#: are skipped
+CODECS = [
+    'gtb', 'json.gz', 'json', 'json.zst', 'json.lz4', 'msgpack',
+    'msgpack.gz', 'msgpack.zst', 'msgpack.lz4'
+]
+
+
+def _time_loading(paths, fields, repeat):
+    """
+    Returns the best time, over `repeat` runs, for loading all the `paths`
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            gt_io._load_file(path, fields)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(dataset,
+              codecs=CODECS,
+              n_songs=20,
+              repeat=3,
+              fields=None,
+              random_state=None):
+    """
+    Compares the ground-truth formats on the songs of `dataset`
+
+    Arguments
+    ---------
+    dataset : asmd.asmd.Dataset
+        the dataset from which the songs are taken
+    codecs : list of str
+        the formats compared (see ``gt_io.codec_path``)
+    n_songs : int
+        the number of songs randomly chosen from `dataset`
+    repeat : int
+        the number of times each file is loaded; the best time is used
+    fields : list of str or None
+        the fields loaded (see ``gt_io.project``); if None, all the fields
+    random_state : int, numpy.random.RandomState or None
+        the random number generator used for choosing the songs
+
+    Returns
+    -------
+    dict :
+        for each format, a dictionary with the total size on disk (``size``,
+        bytes) and the average time for loading a file (``load``, seconds);
+        the files currently installed are reported with key ``installed``
+    """
+    random_state = check_random_state(random_state)
+    songs = random_state.choice(len(dataset),
+                                size=min(n_songs, len(dataset)),
+                                replace=False)
+    sources = sorted({
+        gt_io.resolve(joinpath(dataset.install_dir, gt_fn))
+        for i in songs for gt_fn in dataset.get_gts_paths(i)
+    })
+
+    results = {
+        'installed': {
+            'size': sum(os.path.getsize(path) for path in sources),
+            'load': _time_loading(sources, fields, repeat) / len(sources)
+        }
+    }
+    tmpdir = tempfile.mkdtemp()
+    try:
+        gts = [gt_io._load_file(path) for path in sources]
+        for codec in codecs:
+            paths = [
+                gt_io.codec_path(joinpath(tmpdir, str(j)), codec)
+                for j in range(len(gts))
+            ]
+            try:
+                for gt, path in zip(gts, paths):
+                    gt_io.save(gt, path)
+            except ImportError as e:
+                print("Skipping " + codec + ": " + str(e))
+                continue
+            results[codec] = {
+                'size': sum(os.path.getsize(path) for path in paths),
+                'load': _time_loading(paths, fields, repeat) / len(paths)
+            }
+            for path in paths:
+                os.remove(path)
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def print_results(results):
+    """
+    Prints the output of `benchmark` as a table, relative to the installed
+    files
+    """
+    installed = results['installed']
+    print(f"{'format':<12} {'size (MB)':>10} {'size ratio':>10} "
+          f"{'load (ms)':>10} {'speed-up':>9}")
+    for codec, result in results.items():
+        print(f"{codec:<12} {result['size'] / 2**20:>10.2f} "
+              f"{result['size'] / installed['size']:>10.3f} "
+              f"{result['load'] * 1000:>10.3f} "
+              f"{installed['load'] / result['load']:>9.2f}")
+
+
+if __name__ == '__main__':
+    from .asmd import Dataset
+    from .dataset_utils import filter
+
+    argparser = argparse.ArgumentParser(
+        description='Compare the size and the loading time of the ASMD '
+        'ground-truth formats')
+    argparser.add_argument(
+        '-d',
+        '--datasets',
+        help="List of datasets from which songs are taken (default: all)",
+        nargs='*',
+        default=[])
+    argparser.add_argument('-n',
+                           '--n-songs',
+                           type=int,
+                           default=20,
+                           help="Number of songs")
+    argparser.add_argument('-r',
+                           '--repeat',
+                           type=int,
+                           default=3,
+                           help="Number of times each file is loaded")
+    argparser.add_argument(
+        '-f',
+        '--fields',
+        nargs='*',
+        default=None,
+        help="Fields loaded, e.g. `misaligned instrument` (default: all)")
+    argparser.add_argument('-c',
+                           '--codecs',
+                           nargs='*',
+                           default=CODECS,
+                           help="Formats compared")
+    args = argparser.parse_args()
+
+    dataset = filter(Dataset(), datasets=args.datasets)
+    print_results(
+        benchmark(dataset,
+                  codecs=args.codecs,
+                  n_songs=args.n_songs,
+                  repeat=args.repeat,
+                  fields=args.fields,
+                  random_state=1992))
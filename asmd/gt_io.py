@@ -0,0 +1,602 @@
+"""
+Reading and writing ground-truth files.
+
+Besides the default ``.json.gz`` format, ground-truths can be stored in a
+binary columnar format, which is much faster to load. The binary file lives
+next to the ``.json.gz`` one, with the same name and extension ``.gtb``;
+when it exists and it is not older than the json file, it is preferred over
+it.
+
+The binary layout is the following:
+
+#. the magic string ``ASMDGT`` followed by one byte containing the version
+#. a little-endian uint32 containing the length of the header
+#. the header: a json list with one entry ``[field, dtype, shape, offset]``
+   per field, where ``field`` is the key in the flattened ground-truth (e.g.
+   ``precise_alignment/onsets``) and ``offset`` is relative to the start of
+   the data section
+#. the data section, where each array is stored contiguously and aligned to
+   8 bytes
+
+Times are stored as float64, so that converting a json file to the binary
+format (and removing it) loses no precision, while pitches, velocities and
+pedal values are stored as uint8 whenever possible, and as float64 otherwise. Since each field is a contiguous array,
+files can be memory-mapped and each field can be read without parsing the
+others: when only some `fields` are requested (see :func:`load`), only their
+bytes are read.
+
+Ground-truths can also be encoded with other serializers and compressions,
+chosen by the extension of the file (see :func:`codec_of`): the serializer is
+``json`` (compact, using ``orjson`` when installed) or ``msgpack``, and it can
+be followed by the compression, ``gz``, ``zst`` or ``lz4`` (e.g.
+``.msgpack.zst``). The ``msgpack``, ``zstandard``, ``lz4`` and ``orjson``
+packages are only needed for the corresponding formats. When the file listed
+in the definitions does not exist, the files with the same name and the
+extensions in :data:`EXTENSIONS` are looked for (see :func:`resolve`).
+
+Use this module as a script to convert an existing installation:
+
+>>> python -m asmd.gt_io --remove-source
+>>> python -m asmd.gt_io --codec msgpack.zst --remove-source
+
+See ``asmd.gt_benchmark`` for comparing the formats on an installation.
+"""
+import argparse
+import gzip
+import json
+import os
+import struct
+from os.path import join as joinpath
+from typing import Optional, Tuple
+
+import numpy as np
+
+#: extension of the json ground-truth files
+JSON_EXT = '.json.gz'
+
+#: extension of the binary ground-truth files
+BINARY_EXT = '.gtb'
+
+#: extensions of the encoded ground-truth files, in the order in which they
+#: are looked for when the file listed in the definitions does not exist
+EXTENSIONS = [
+    '.msgpack.lz4', '.msgpack.zst', '.json.lz4', '.json.zst', '.msgpack',
+    '.json', '.msgpack.gz', JSON_EXT
+]
+
+# the available serializers and compressions (see `codec_of`)
+_SERIALIZERS = ['json', 'msgpack']
+_COMPRESSIONS = ['gz', 'zst', 'lz4']
+
+#: separator used for flattening the nested ground-truth dictionary
+SEP = '/'
+
+_MAGIC = b'ASMDGT'
+_VERSION = 1
+_ALIGN = 8
+
+# fields stored as float64
+_FLOAT_FIELDS = {'onsets', 'offsets', 'beats', 'times', 'f0'}
+# fields stored as uint8 if they only contain integers in [0, 255]
+_SMALL_INT_FIELDS = {'pitches', 'velocities', 'values', 'instrument'}
+# fields stored as bool
+_BOOL_FIELDS = {'missing', 'extra'}
+
+
+def _stem(gt_fn: str) -> str:
+    """
+    Returns `gt_fn` without the extension of a ground-truth format
+    """
+    for ext in [BINARY_EXT] + EXTENSIONS:
+        if gt_fn.endswith(ext):
+            return gt_fn[:-len(ext)]
+    return gt_fn
+
+
+def binary_path(gt_fn: str) -> str:
+    """
+    Returns the path of the binary ground-truth corresponding to `gt_fn`
+    """
+    return _stem(gt_fn) + BINARY_EXT
+
+
+def codec_path(gt_fn: str, codec: str) -> str:
+    """
+    Returns the path of the ground-truth corresponding to `gt_fn` encoded with
+    `codec`, e.g. ``'msgpack.zst'`` or ``'gtb'`` for the binary format
+    """
+    return _stem(gt_fn) + '.' + codec
+
+
+def resolve(gt_fn: str) -> str:
+    """
+    Returns the path of the file loaded for the ground-truth `gt_fn`, as
+    listed in the definitions: the binary file, if it exists and it is not
+    older than `gt_fn` (e.g. after `gt_fn` is written again by
+    ``asmd.conversion_tool``), otherwise `gt_fn`, if it exists, otherwise the
+    first file with the same name and one of the :data:`EXTENSIONS`. If none
+    exists, `gt_fn` is returned.
+
+    The extension found in each directory is remembered and tried first for
+    the other files of the same directory, so that an installation converted
+    with `remove_source` needs at most three lookups per file.
+    """
+    binary = binary_path(gt_fn)
+    binary_mtime = _mtime(binary)
+    source_mtime = _mtime(gt_fn)
+    if binary_mtime is not None and (source_mtime is None
+                                     or binary_mtime >= source_mtime):
+        return binary
+    if source_mtime is not None:
+        return gt_fn
+    stem = _stem(gt_fn)
+    directory = os.path.dirname(gt_fn)
+    ext = _found_extensions.get(directory)
+    if ext is not None and os.path.exists(stem + ext):
+        return stem + ext
+    for ext in EXTENSIONS:
+        if os.path.exists(stem + ext):
+            _found_extensions[directory] = ext
+            return stem + ext
+    return gt_fn
+
+
+def _mtime(path: str) -> Optional[int]:
+    """
+    Returns the modification time of `path` (ns), or None if it does not
+    exist
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+# the extension last found by `resolve` in each directory
+_found_extensions: dict = {}
+
+
+def codec_of(gt_fn: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns the serializer (``'json'`` or ``'msgpack'``) and the compression
+    (``'gz'``, ``'zst'``, ``'lz4'`` or None) of an encoded ground-truth from
+    the extension of `gt_fn`
+    """
+    parts = os.path.basename(gt_fn).split('.')
+    compression = None
+    if parts[-1] in _COMPRESSIONS:
+        compression = parts.pop()
+    if len(parts) < 2 or parts[-1] not in _SERIALIZERS:
+        raise ValueError("Unknown ground-truth format: " + gt_fn)
+    return parts[-1], compression
+
+
+def _compress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == 'gz':
+        return gzip.compress(data)
+    elif compression == 'zst':
+        import zstandard
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    elif compression == 'lz4':
+        import lz4.frame
+        return lz4.frame.compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == 'gz':
+        return gzip.decompress(data)
+    elif compression == 'zst':
+        import zstandard
+        # also works for frames without the content size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    elif compression == 'lz4':
+        import lz4.frame
+        return lz4.frame.decompress(data)
+    return data
+
+
+def _to_lists(value):
+    """
+    Converts the numpy arrays and scalars in a ground-truth to lists and
+    Python scalars
+    """
+    if isinstance(value, dict):
+        return {key: _to_lists(subvalue) for key, subvalue in value.items()}
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def encode(gt: dict, serializer='json', compression=None) -> bytes:
+    """
+    Returns the ground-truth `gt` serialized and compressed (see
+    :func:`codec_of`). Json is written without spaces and with sorted keys.
+    """
+    gt = _to_lists(gt)
+    if serializer == 'json':
+        try:
+            import orjson
+            data = orjson.dumps(gt, option=orjson.OPT_SORT_KEYS)
+        except ImportError:
+            data = json.dumps(gt, sort_keys=True,
+                              separators=(',', ':')).encode()
+    elif serializer == 'msgpack':
+        import msgpack
+        data = msgpack.packb(gt, use_bin_type=True)
+    else:
+        raise ValueError("Unknown serializer: " + str(serializer))
+    return _compress(data, compression)
+
+
+def decode(data: bytes, serializer='json', compression=None) -> dict:
+    """
+    Inverse of :func:`encode`
+    """
+    data = _decompress(data, compression)
+    if serializer == 'json':
+        try:
+            import orjson
+            return orjson.loads(data)
+        except ImportError:
+            return json.loads(data)
+    elif serializer == 'msgpack':
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+    raise ValueError("Unknown serializer: " + str(serializer))
+
+
+def _to_array(key: str, value) -> np.ndarray:
+    """
+    Converts the value of a ground-truth field to a compact numpy array
+    """
+    if key in _FLOAT_FIELDS:
+        return np.asarray(value, dtype=np.float64)
+    if key in _BOOL_FIELDS:
+        return np.asarray(value, dtype=bool)
+    if key in _SMALL_INT_FIELDS:
+        arr = np.asarray(value, dtype=np.float64)
+        if np.all((arr >= 0) & (arr <= 255) & (np.mod(arr, 1) == 0)):
+            return arr.astype(np.uint8)
+        return arr
+    if key == 'notes':
+        return np.asarray(value, dtype=str)
+    return np.asarray(value)
+
+
+def flatten(gt: dict) -> dict:
+    """
+    Returns a flat dictionary of numpy arrays with keys like
+    ``'score/onsets'`` from a ground-truth dictionary
+    """
+    out = {}
+    for key, value in gt.items():
+        if isinstance(value, dict):
+            for subkey, subvalue in value.items():
+                out[key + SEP + subkey] = _to_array(subkey, subvalue)
+        else:
+            out[key] = _to_array(key, value)
+    return out
+
+
+def unflatten(arrays) -> dict:
+    """
+    Inverse of :func:`flatten`: rebuilds the nested ground-truth dictionary
+    from a mapping of arrays. `instrument` is converted back to an int, all
+    the other fields are left as numpy arrays.
+    """
+    gt = {}
+    for key in arrays:
+        value = arrays[key]
+        if SEP in key:
+            key, subkey = key.split(SEP, 1)
+            gt.setdefault(key, {})[subkey] = value
+        elif key == 'instrument':
+            gt[key] = int(value)
+        else:
+            gt[key] = value
+    return gt
+
+
+class ReadOnlyDict(dict):
+    """
+    A dictionary which raises `TypeError` when modified; used for sharing
+    ground-truths among multiple callers (see :func:`freeze`)
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("This ground-truth is read-only, copy it if you "
+                        "need to modify it")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (type(self), (dict(self), ))
+
+
+def freeze(gt: dict):
+    """
+    Returns a read-only version of the ground-truth `gt` and its size in
+    bytes: lists are converted to read-only arrays and dictionaries to
+    :class:`ReadOnlyDict`.
+    """
+    out = {}
+    nbytes = 0
+    for key, value in gt.items():
+        if isinstance(value, dict):
+            value, value_nbytes = freeze(value)
+        elif isinstance(value, (list, np.ndarray)):
+            # a new view, so that other references to the array are untouched
+            value = np.asarray(value).view()
+            value.flags.writeable = False
+            value_nbytes = value.nbytes
+        else:
+            value_nbytes = 8
+        out[key] = value
+        nbytes += value_nbytes
+    return ReadOnlyDict(out), nbytes
+
+
+def save_binary(gt: dict, path: str):
+    """
+    Writes the ground-truth dictionary `gt` to `path` in the binary format
+    """
+    arrays = flatten(gt)
+    header = []
+    offset = 0
+    for key, arr in arrays.items():
+        # little-endian is used for the stored data
+        arr = arrays[key] = arr.astype(arr.dtype.newbyteorder('<'))
+        header.append([key, arr.dtype.str, arr.shape, offset])
+        offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+
+    header = json.dumps(header, separators=(',', ':')).encode()
+    # padding the header so that the data section is aligned
+    start = len(_MAGIC) + 1 + 4 + len(header)
+    header += b' ' * (-start % _ALIGN)
+
+    with open(path, 'wb') as f:
+        f.write(_MAGIC + struct.pack('<BI', _VERSION, len(header)))
+        f.write(header)
+        for arr in arrays.values():
+            data = arr.tobytes()
+            f.write(data)
+            f.write(b'\0' * (-len(data) % _ALIGN))
+
+
+def _selected(key: str, fields) -> bool:
+    """
+    Returns True if the flattened `key` is one of `fields` or is contained in
+    one of them
+    """
+    return fields is None or any(key == field or key.startswith(field + SEP)
+                                 for field in fields)
+
+
+def project(gt: dict, fields) -> dict:
+    """
+    Returns a new ground-truth dictionary with only the `fields` of `gt`;
+    fields are keys (e.g. ``'score'``) or flattened keys (e.g.
+    ``'score/onsets'``). Fields not in `gt` are ignored. If `fields` is None,
+    `gt` is returned.
+    """
+    if fields is None:
+        return gt
+    out = {}
+    for field in fields:
+        key, _, subkey = field.partition(SEP)
+        if key not in gt:
+            continue
+        if subkey:
+            if subkey in gt[key]:
+                out.setdefault(key, {})[subkey] = gt[key][subkey]
+        else:
+            out[key] = gt[key]
+    return out
+
+
+def _read_header(f):
+    """
+    Reads the header of a binary ground-truth from the file object `f` and
+    returns it together with the position of the data section
+    """
+    head_start = len(_MAGIC) + 5
+    prefix = f.read(head_start)
+    magic, (version, head_len) = prefix[:len(_MAGIC)], struct.unpack(
+        '<BI', prefix[len(_MAGIC):head_start])
+    if magic != _MAGIC or version != _VERSION:
+        raise RuntimeError("Not a valid ground-truth binary file: " + f.name)
+    return json.loads(f.read(head_len)), head_start + head_len
+
+
+def load_binary(path: str, mmap=False, fields=None) -> dict:
+    """
+    Loads a ground-truth stored in the binary format. If `mmap` is True, the
+    file is memory-mapped and the returned arrays are read-only.
+
+    If `fields` is not None, only those fields are read (see :func:`project`).
+    """
+    with open(path, 'rb') as f:
+        header, data_start = _read_header(f)
+        header = [entry for entry in header if _selected(entry[0], fields)]
+        if mmap:
+            buf = np.memmap(path, dtype=np.uint8, mode='r')
+        elif fields is None:
+            buf = bytearray(f.read())
+            data_start = 0
+        else:
+            buf = None
+
+        arrays = {}
+        for key, dtype, shape, offset in header:
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape))
+            if buf is None:
+                # reading only the bytes of this field
+                f.seek(data_start + offset)
+                arrays[key] = np.frombuffer(bytearray(
+                    f.read(count * dtype.itemsize)),
+                                            dtype=dtype).reshape(shape)
+            else:
+                arrays[key] = np.frombuffer(buf,
+                                            dtype=dtype,
+                                            count=count,
+                                            offset=data_start +
+                                            offset).reshape(shape)
+    return unflatten(arrays)
+
+
+def field_lengths(path: str) -> Optional[dict]:
+    """
+    Returns the length of each flattened field of the ground-truth `path`
+    (as listed in the definitions, see :func:`resolve`), read from the
+    header of its binary file without reading the data; returns None if the
+    ground-truth is not stored in the binary format
+    """
+    path = resolve(path)
+    if not path.endswith(BINARY_EXT):
+        return None
+    with open(path, 'rb') as f:
+        header, _ = _read_header(f)
+    return {
+        key: shape[0] if len(shape) > 0 else 1
+        for key, _, shape, _ in header
+    }
+
+
+def load_json(path: str, fields=None) -> dict:
+    """
+    Loads a ground-truth encoded according to the extension of `path` (e.g.
+    ``.json.gz``, see :func:`codec_of`). If `fields` is not None, only those
+    fields are kept (see :func:`project`).
+    """
+    with open(path, 'rb') as f:
+        return project(decode(f.read(), *codec_of(path)), fields)
+
+
+def _load_file(path: str, fields=None) -> dict:
+    """
+    Loads the ground-truth file `path` in the format given by its extension
+    """
+    if path.endswith(BINARY_EXT):
+        return load_binary(path, fields=fields)
+    return load_json(path, fields)
+
+
+def load(path: str, fields=None) -> dict:
+    """
+    Loads the ground-truth at `path`, using the binary version if available
+    (see :func:`resolve`).
+
+    `path` is the path as listed in the definitions (i.e. with ``.json.gz``
+    extension). If `fields` is not None, only those fields are loaded (see
+    :func:`project`).
+    """
+    return _load_file(resolve(path), fields)
+
+
+def save(gt: dict, path: str):
+    """
+    Writes the ground-truth `gt` to `path`, in the format given by the
+    extension of `path` (the binary format or one of :func:`codec_of`)
+    """
+    if path.endswith(BINARY_EXT):
+        save_binary(gt, path)
+        return
+    data = encode(gt, *codec_of(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def remove_other_formats(path: str):
+    """
+    Removes the files of the ground-truth `path` stored in any other format,
+    so that `path` is the one loaded (see :func:`resolve`) after it is
+    written again
+    """
+    stem = _stem(path)
+    for ext in [BINARY_EXT] + EXTENSIONS:
+        if stem + ext != path and os.path.exists(stem + ext):
+            os.remove(stem + ext)
+
+
+def convert_file(path: str, remove_source=False, codec='gtb') -> str:
+    """
+    Writes the ground-truth `path` (as listed in the definitions, see
+    :func:`resolve`) encoded with `codec` (e.g. ``'gtb'`` or
+    ``'msgpack.zst'``, see :func:`codec_path`) and returns the written path.
+    If `remove_source` is True, the file it was converted from is deleted.
+
+    The file listed in the definitions is converted if it exists, so that no
+    precision is lost by converting from the binary format.
+    """
+    source = path if os.path.exists(path) else resolve(path)
+    dest = codec_path(path, codec)
+    if source == dest:
+        return dest
+    save(_load_file(source), dest)
+    if remove_source:
+        os.remove(source)
+    return dest
+
+
+def _convert_song(i, dataset, remove_source, codec):
+    out = []
+    # some songs list the same ground-truth multiple times (PHENICX)
+    for gt_fn in sorted(set(dataset.get_gts_paths(i))):
+        path = joinpath(dataset.install_dir, gt_fn)
+        if os.path.exists(resolve(path)):
+            out.append(convert_file(path, remove_source, codec))
+    return out
+
+
+def convert_dataset(dataset, remove_source=False, codec='gtb', **kwargs):
+    """
+    Converts all the ground-truths of an `asmd.asmd.Dataset` to `codec` (the
+    binary format by default, see :func:`convert_file`). `kwargs` are passed
+    to `Dataset.parallel`.
+
+    Returns the list of written paths.
+    """
+    return sum(
+        dataset.parallel(_convert_song, remove_source, codec, **kwargs), [])
+
+
+if __name__ == '__main__':
+    from .asmd import Dataset
+    from .dataset_utils import filter
+
+    argparser = argparse.ArgumentParser(
+        description='Convert ASMD ground-truth to the binary format or to '
+        'another encoding')
+    argparser.add_argument(
+        '-r',
+        '--remove-source',
+        '--remove-json',
+        action='store_true',
+        help="Remove the files from which ground-truths are converted")
+    argparser.add_argument(
+        '-c',
+        '--codec',
+        default='gtb',
+        help="The format of the converted files, e.g. `gtb` (default), "
+        "`json.zst` or `msgpack.lz4`")
+    argparser.add_argument(
+        '-d',
+        '--datasets',
+        help="List of datasets that will be converted (default: all)",
+        nargs='*',
+        default=[])
+    argparser.add_argument('-j',
+                           '--n-jobs',
+                           type=int,
+                           default=-1,
+                           help="Number of parallel jobs")
+    args = argparser.parse_args()
+
+    dataset = filter(Dataset(), datasets=args.datasets)
+    written = convert_dataset(dataset,
+                              remove_source=args.remove_source,
+                              codec=args.codec,
+                              n_jobs=args.n_jobs)
+    print(f"Converted {len(written)} ground-truth files")
@@ -1,8 +1,16 @@
+import atexit
+import hashlib
+import os
 import pathlib
-from typing import Union, Tuple
+import pickle
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional, Tuple, Union
 import numpy as np
 from essentia.standard import EasyLoader as Loader
-from essentia.standard import MetadataReader
+from essentia.standard import MetadataReader, Resample
+from scipy.io import wavfile
 
 
 def nframes(dur, hop_size=3072, win_len=4096) -> float:
@@ -39,22 +47,124 @@ def time2frame(time, hop_size=3072, win_len=4096) -> int:
     return round((time - win_len / 2) / hop_size)
 
 
-def open_audio(audio_fn: Union[str, pathlib.Path]) -> Tuple[np.ndarray, int]:
+def open_audio(audio_fn: Union[str, pathlib.Path],
+               sr: Optional[int] = None,
+               cache=None,
+               start: Optional[float] = None,
+               end: Optional[float] = None,
+               metadata=None) -> Tuple[np.ndarray, int]:
     """
     Open the audio file in `audio_fn` and returns a numpy array containing it,
     one row for each channel (only Mono supported for now) and the orginal
     sample_rate
+
+    If `sr` is not None, the audio is resampled to `sr`, which is returned
+    instead of the original sample rate.
+
+    If `start` and/or `end` are not None, only the audio between them (in
+    seconds) is returned; uncompressed wav files are read by seeking to
+    `start`, so that only the requested samples are read and resampled (see
+    `can_seek`). Other formats (e.g. mp3 or flac) are decoded from the
+    beginning of the file up to `end` and then trimmed, so reading an excerpt
+    costs as much as decoding all the audio before it.
+
+    If `cache` is a `DiskCache`, the decoded audio is stored in it, keyed by
+    path, modification time and sample rate; when it is already there, it is
+    returned as a read-only `numpy.memmap` without decoding the file. With a
+    cache, the whole file is decoded once and then sliced according to
+    `start` and `end`.
+
+    If `metadata` is an `AudioMetadata`, the sample rate of the file is read
+    from it instead of probing the file.
     """
 
-    reader = MetadataReader(filename=str(audio_fn), filterMetadata=True)
-    sample_rate = reader()[-2]
+    if metadata is not None:
+        sample_rate = metadata.get(audio_fn)[2]
+    else:
+        reader = MetadataReader(filename=str(audio_fn), filterMetadata=True)
+        sample_rate = reader()[-2]
     if sample_rate == 0:
         raise RuntimeError("No sample rate metadata in file " + str(audio_fn))
+    if sr is None:
+        sr = sample_rate
+    # same as the essentia `Trimmer`
+    first = int(start * sr) if start is not None else None
+    last = int(end * sr) if end is not None else None
+
+    if cache is not None:
+        key = ('audio', os.path.abspath(str(audio_fn)),
+               os.stat(audio_fn).st_mtime_ns, sr)
+        audio = cache.get(key, mmap=True)
+        if audio is None:
+            audio = Loader(filename=str(audio_fn),
+                           sampleRate=sr,
+                           endTime=1e+07)()
+            cache.put(key, audio)
+        return audio[first:last], sr
+
+    if start is None and end is None:
+        loader = Loader(filename=str(audio_fn), sampleRate=sr, endTime=1e+07)
+        return loader(), sr
+
+    audio = _read_wav(audio_fn, start, end)
+    if audio is None:
+        loader = Loader(filename=str(audio_fn),
+                        sampleRate=sr,
+                        startTime=start or 0,
+                        endTime=1e+07 if end is None else end)
+        return loader(), sr
+    if sr != sample_rate:
+        audio = resample(audio, sample_rate, sr)
+    return audio, sr
+
+
+def resample(audio: np.ndarray, sr: int, new_sr: int) -> np.ndarray:
+    """
+    Resamples `audio` from `sr` to `new_sr` with
+    ``essentia.standard.Resample``
+    """
+    return Resample(inputSampleRate=sr, outputSampleRate=new_sr)(audio)
+
+
+def can_seek(audio_fn: Union[str, pathlib.Path]) -> bool:
+    """
+    Returns True if excerpts of `audio_fn` can be read by `open_audio`
+    without decoding the audio before them, i.e. if it is an uncompressed wav
+    file
+    """
+    return _read_wav(audio_fn, 0, 0) is not None
+
+
+def _read_wav(audio_fn, start, end) -> Optional[np.ndarray]:
+    """
+    Reads the samples between `start` and `end` (seconds, None for the
+    beginning/end of the file) of an uncompressed wav file by
+    memory-mapping it. Samples are converted to mono float32 as the
+    essentia loaders do.
 
-    loader = Loader(filename=str(audio_fn),
-                    sampleRate=sample_rate,
-                    endTime=1e+07)
-    return loader(), sample_rate
+    Returns None if the file is not supported.
+    """
+    if not str(audio_fn).lower().endswith('.wav'):
+        return None
+    try:
+        file_sr, data = wavfile.read(str(audio_fn), mmap=True)
+    except ValueError:
+        # e.g. compressed or 24-bit files
+        return None
+    first = int(start * file_sr) if start is not None else None
+    last = int(end * file_sr) if end is not None else None
+    data = data[first:last]
+
+    if data.dtype == np.uint8:
+        audio = (data.astype(np.float32) - 128) / 128
+    elif data.dtype.kind == 'i':
+        audio = data.astype(np.float32) / -float(np.iinfo(data.dtype).min)
+    else:
+        audio = data.astype(np.float32)
+    if audio.ndim > 1:
+        # essentia mixes the channels by averaging them
+        audio = audio.mean(axis=1, dtype=np.float32)
+    return audio
 
 
 def f0_to_midi_pitch(f0):
@@ -137,3 +247,715 @@ def mat_stretch(mat, target):
     in_times += new_start
 
     return mat
+
+
+class PianorollRuns(NamedTuple):
+    """
+    Run-length representation of a pianoroll with shape `shape`: the cells
+    ``[pitches[i], starts[i]:ends[i]]`` contain ``values[i]`` and all the
+    other cells contain 0. Runs are sorted by pitch and start and never
+    overlap.
+    """
+    pitches: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    values: np.ndarray
+    shape: Tuple[int, int]
+
+
+def pianoroll_runs(pitches,
+                   starts,
+                   ends,
+                   values,
+                   n_cols: int,
+                   onsets=False,
+                   dtype=np.float64) -> PianorollRuns:
+    """
+    Computes the runs of a pianoroll with 128 rows and `n_cols` columns, in
+    which each note ``i`` is written in the columns ``starts[i]:ends[i]`` of
+    row ``pitches[i]`` with value ``values[i]``. Notes are written in order,
+    so that the last one wins where they overlap; if `onsets` is True, each
+    note writes -1 in its first column after writing its value.
+
+    Notes which do not overlap other notes with the same pitch are runs by
+    themselves; overlapping notes are resolved cell by cell.
+    """
+    pitches = np.asarray(pitches, dtype=np.intp)
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    values = np.asarray(values, dtype=np.float64)
+    if onsets:
+        # the onset is written even if the note is empty
+        ends = np.maximum(ends, starts + 1)
+
+    # sorting by pitch and start, dropping notes that write nothing; lexsort
+    # is stable, so notes with the same start keep the writing order
+    order = np.flatnonzero(ends > starts)
+    order = order[np.lexsort((starts[order], pitches[order]))]
+    p, s, e = pitches[order], starts[order], ends[order]
+
+    # grouping notes which overlap with a previous note of the same pitch:
+    # adding `pitch * big` makes the running maximum restart at each pitch
+    big = max(n_cols, int(e.max(initial=0))) + 1
+    prev_end = np.maximum.accumulate(p * big + e)
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = p[1:] * big + s[1:] >= prev_end[:-1]
+    group_starts = np.flatnonzero(new_group)
+    sizes = np.diff(np.append(group_starts, len(order)))
+
+    # non-overlapping notes are runs by themselves
+    single = np.repeat(sizes == 1, sizes)
+    run_p, run_s, run_e, run_id = [p[single]], [s[single]], [e[single]], [
+        order[single]
+    ]
+
+    # overlapping notes are split in cells and, for each cell, the last
+    # note written is kept
+    overlapping = np.sort(order[~single])
+    if len(overlapping) > 0:
+        which, cells = _cells(starts[overlapping], ends[overlapping])
+        notes = overlapping[which]
+        key = pitches[notes] * big + cells
+        # stable, so that the notes of each cell stay in writing order
+        srt = np.argsort(key, kind='stable')
+        key, notes = key[srt], notes[srt]
+        last = np.append(key[1:] != key[:-1], True)
+        key, notes = key[last], notes[last]
+
+        # consecutive cells written by the same note form a run
+        new_run = np.ones(len(key), dtype=bool)
+        new_run[1:] = (key[1:] != key[:-1] + 1) | (notes[1:] != notes[:-1])
+        first = np.flatnonzero(new_run)
+        end = key[np.append(first[1:], len(key)) - 1] + 1
+        run_p.append(key[first] // big)
+        run_s.append(key[first] % big)
+        run_e.append(end - run_p[-1] * big)
+        run_id.append(notes[first])
+
+    run_p, run_s, run_e, run_id = (np.concatenate(x)
+                                   for x in (run_p, run_s, run_e, run_id))
+    run_v = values[run_id]
+
+    if onsets:
+        # runs starting at the onset of their note begin with -1
+        head = np.flatnonzero(run_s == starts[run_id])
+        tail = head[run_e[head] > run_s[head] + 1]
+        run_p = np.concatenate([run_p, run_p[tail]])
+        run_s = np.concatenate([run_s, run_s[tail] + 1])
+        run_e = np.concatenate([run_e, run_e[tail]])
+        run_v = np.concatenate([run_v, run_v[tail]])
+        run_e[head] = run_s[head] + 1
+        run_v[head] = -1
+
+    order = np.lexsort((run_s, run_p))
+    return PianorollRuns(run_p[order], run_s[order], run_e[order],
+                         run_v[order].astype(dtype), (128, n_cols))
+
+
+def _cells(starts, ends):
+    """
+    Returns, for each cell in the intervals ``starts[i]:ends[i]``, the index
+    of its interval and its position
+    """
+    lengths = ends - starts
+    total = int(lengths.sum())
+    # the position of each cell is its interval start plus its offset in the
+    # interval
+    first = np.cumsum(lengths) - lengths
+    which = np.repeat(np.arange(len(lengths)), lengths)
+    return which, np.arange(total, dtype=np.intp) + (starts - first)[which]
+
+
+def _expand_runs(runs: PianorollRuns):
+    """
+    Returns rows, columns and values of the non-zero cells in `runs`
+    """
+    which, cols = _cells(runs.starts, runs.ends)
+    return runs.pitches[which], cols, runs.values[which]
+
+
+def runs_to_dense(runs: PianorollRuns, out=None) -> np.ndarray:
+    """
+    Returns the dense pianoroll represented by `runs`; if `out` is provided,
+    it must be a zeroed array (or a view of one) with shape ``runs.shape``:
+    the runs are written into it and it is returned.
+    """
+    if out is not None:
+        rows, cols, values = _expand_runs(runs)
+        out[rows, cols] = values
+        return out
+
+    n_rows, n_cols = runs.shape
+    # the flattened matrix is an alternation of zeros and runs
+    flat_starts = runs.pitches * n_cols + runs.starts
+    flat_ends = runs.pitches * n_cols + runs.ends
+    values = np.zeros(2 * len(flat_starts) + 1, dtype=runs.values.dtype)
+    values[1::2] = runs.values
+    lengths = np.empty(len(values), dtype=np.intp)
+    lengths[0:-1:2] = flat_starts - np.append(0, flat_ends[:-1])
+    lengths[1::2] = flat_ends - flat_starts
+    lengths[-1] = n_rows * n_cols - (flat_ends[-1] if len(flat_ends) else 0)
+    return np.repeat(values, lengths).reshape(runs.shape)
+
+
+def runs_to_sparse(runs: PianorollRuns):
+    """
+    Returns the pianoroll represented by `runs` as a `scipy.sparse.csr_matrix`
+    """
+    from scipy.sparse import csr_matrix
+
+    rows, cols, values = _expand_runs(runs)
+    return csr_matrix((values, (rows, cols)),
+                      shape=runs.shape,
+                      dtype=runs.values.dtype)
+
+
+class NoteIndex(object):
+    """
+    An index of the notes of a score matrix (see
+    ``asmd.dataset_utils.get_score_mat``) for querying them by time.
+
+    Notes are sorted by onset and split into groups whose durations differ at
+    most by a factor of 2 (very short notes are grouped together). Since no
+    note of a group starting before ``t - max_dur`` (the longest duration in
+    the group) can still sound at time ``t``, each query is answered with
+    binary searches on the onsets of all the groups at once and a check of
+    the offsets of the notes in between, in O(g log n + k) for g groups and k
+    found notes, even when a few notes are much longer than the others.
+
+    Arguments
+    ---------
+    notes : numpy.ndarray
+        a (n x m) array whose columns 1 and 2 contain onsets and offsets
+    """
+    # notes shorter than this (seconds) are put in the same group
+    _MIN_GROUP_DURATION = 2.0**-10
+
+    def __init__(self, notes: np.ndarray):
+        order = np.argsort(notes[:, 1], kind='stable')
+        self.notes = notes[order]
+        self.onsets = np.ascontiguousarray(self.notes[:, 1])
+        self.offsets = np.ascontiguousarray(self.notes[:, 2])
+
+        n = len(self.notes)
+        durations = self.offsets - self.onsets
+        classes = np.frexp(np.maximum(durations,
+                                      self._MIN_GROUP_DURATION))[1]
+        _, groups = np.unique(classes, return_inverse=True)
+        groups = groups.reshape(-1)
+        n_groups = groups.max() + 1 if n > 0 else 0
+        self._max_durs = np.zeros(n_groups)
+        np.maximum.at(self._max_durs, groups, durations)
+        # the positions of the notes sorted by group and then by onset, and
+        # their keys ``group * n + position`` for the binary searches
+        self._positions = np.argsort(groups, kind='stable')
+        self._keys = groups[self._positions] * n + self._positions
+        self._group_keys = np.arange(n_groups) * n
+
+    def __len__(self):
+        return len(self.notes)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The number of bytes used by the index
+        """
+        return (self.notes.nbytes + self.onsets.nbytes + self.offsets.nbytes +
+                self._positions.nbytes + self._keys.nbytes)
+
+    def _select(self, t0, t1, side='left') -> list:
+        """
+        Returns, for each window ``(t0[w], t1[w])``, the notes starting
+        before ``t1[w]`` (or not after it, if `side` is ``'right'``) and
+        ending after ``t0[w]``, sorted by onset
+        """
+        t0 = np.atleast_1d(np.asarray(t0, dtype=np.float64))
+        t1 = np.atleast_1d(np.asarray(t1, dtype=np.float64))
+        n_windows = len(t0)
+        if len(self.notes) == 0:
+            return [self.notes] * n_windows
+        # in each group, the notes between positions `first` and `last`
+        first = np.searchsorted(self.onsets,
+                                t0[:, None] - self._max_durs,
+                                side='left')
+        last = np.searchsorted(self.onsets, t1, side=side)
+        lo = np.searchsorted(self._keys, self._group_keys + first).ravel()
+        hi = np.searchsorted(self._keys,
+                             self._group_keys + last[:, None]).ravel()
+        lengths = np.maximum(hi - lo, 0)
+        ends = np.cumsum(lengths)
+        idx = np.arange(ends[-1]) + np.repeat(lo - ends + lengths, lengths)
+        positions = self._positions[idx]
+        windows = np.repeat(np.arange(n_windows),
+                            lengths.reshape(n_windows, -1).sum(axis=1))
+        keep = self.offsets[positions] > t0[windows]
+        positions, windows = positions[keep], windows[keep]
+        if n_windows == 1:
+            return [self.notes[np.sort(positions)]]
+        order = np.lexsort((positions, windows))
+        counts = np.bincount(windows, minlength=n_windows)
+        return np.split(self.notes[positions[order]], np.cumsum(counts)[:-1])
+
+    def between(self, t0: float, t1: float) -> np.ndarray:
+        """
+        Returns the notes starting before `t1` and ending after `t0`
+        """
+        return self._select(t0, t1)[0]
+
+    def active_at(self, t: float) -> np.ndarray:
+        """
+        Returns the notes sounding at time `t`, i.e. starting not after `t`
+        and ending after it
+        """
+        return self._select(t, t, side='right')[0]
+
+    def between_many(self, windows) -> list:
+        """
+        Returns the notes in each window, as `between` would do
+
+        Arguments
+        ---------
+        windows : numpy.ndarray
+            a (w x 2) array with the start and the end of each window
+
+        Returns
+        -------
+        list :
+            the w arrays of notes of each window
+        """
+        windows = np.asarray(windows, dtype=np.float64).reshape(-1, 2)
+        if len(windows) == 0:
+            return []
+        return self._select(windows[:, 0], windows[:, 1])
+
+
+class LRUCache(object):
+    """
+    A least-recently-used cache whose size is bounded by the total number of
+    bytes of the stored values.
+
+    The number of bytes of each value must be provided when the value is
+    stored. Hits and misses are counted in the attributes ``hits`` and
+    ``misses``. The cache is thread-safe; the stored values are not pickled
+    together with the cache, so that it can be sent to other processes
+    cheaply.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_data'] = OrderedDict()
+        state['nbytes'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        """
+        Returns the value stored for `key` and marks it as the most recently
+        used; returns `default` if `key` is not in the cache
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value, nbytes: int):
+        """
+        Stores `value` for `key`, evicting the least recently used values
+        until the total size fits in ``max_bytes``. Values larger than
+        ``max_bytes`` are not stored.
+        """
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._data[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _key, (_value, _nbytes) = self._data.popitem(last=False)
+                self.nbytes -= _nbytes
+
+    def invalidate(self, key: Hashable):
+        """
+        Removes `key` from the cache, if present
+        """
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        """
+        Removes all the values and resets the counters
+        """
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class DiskCache(object):
+    """
+    A cache of numpy arrays stored as ``.npy`` files in the directory `path`,
+    whose total size is bounded by `max_bytes`: when the total size exceeds
+    it, the least recently used files are removed until it fits in
+    `_EVICTION_RATIO` times `max_bytes`. The total size is tracked in memory
+    and the directory is only scanned when it exceeds `max_bytes`.
+
+    Keys must have a deterministic ``repr`` (e.g. tuples of strings and
+    numbers). Files are written atomically, so that multiple processes can
+    share the same directory; the modification time of each file is used as
+    its time of last use. Hits and misses of this process are counted in the
+    attributes ``hits`` and ``misses``.
+    """
+    # the fraction of `max_bytes` left after evicting files, so that the
+    # directory is not scanned at each `put` when the cache is full
+    _EVICTION_RATIO = 0.9
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # the total size of the files, known after the first scan; files
+        # written by other processes are only counted at the next scan
+        self._nbytes: Optional[int] = None
+        os.makedirs(path, exist_ok=True)
+
+    def filename(self, key: Hashable) -> str:
+        """
+        Returns the path of the file storing `key`
+        """
+        return os.path.join(self.path,
+                            hashlib.sha1(repr(key).encode()).hexdigest() +
+                            '.npy')
+
+    def get(self, key: Hashable, default=None, mmap=False):
+        """
+        Returns the array stored for `key`, or `default` if it is not in the
+        cache. If `mmap` is True, the array is memory-mapped in read-only
+        mode.
+        """
+        fn = self.filename(key)
+        try:
+            value = np.load(fn, mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            # missing, or removed/corrupted by another process
+            self.misses += 1
+            return default
+        try:
+            os.utime(fn)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        """
+        Stores `value` for `key` and evicts the least recently used files.
+        Values larger than ``max_bytes`` are not stored.
+        """
+        if value.nbytes > self.max_bytes:
+            return
+        fn = self.filename(key)
+        tmp = '{}.{}-{}.tmp'.format(fn, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp, 'wb') as f:
+                np.save(f, value)
+            size = os.path.getsize(tmp)
+            replaced = _file_size(fn)
+            os.replace(tmp, fn)
+        except OSError:
+            # the cache is not writable; nothing is stored
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        if self._nbytes is None:
+            self.evict()
+            return
+        self._nbytes += size - replaced
+        if self._nbytes > self.max_bytes:
+            self.evict(int(self.max_bytes * self._EVICTION_RATIO))
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """
+        Scans the directory and removes the least recently used files until
+        the total size fits in `max_bytes` (by default, ``self.max_bytes``)
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(entry[1] for entry in entries)
+        for _mtime, size, fn in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+            total -= size
+        self._nbytes = total
+
+    def invalidate(self, key: Hashable):
+        """
+        Removes `key` from the cache, if present
+        """
+        fn = self.filename(key)
+        size = _file_size(fn)
+        try:
+            os.remove(fn)
+        except OSError:
+            return
+        if self._nbytes is not None:
+            self._nbytes -= size
+
+    def clear(self):
+        """
+        Removes all the stored files and resets the counters
+        """
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+def _file_size(path: str) -> int:
+    """
+    Returns the size of `path`, or 0 if it does not exist
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class PersistentTable(object):
+    """
+    Base class of the tables of entries stored in the file `path` and loaded
+    when first needed; if `path` is None, the table is only kept in memory.
+
+    Multiple processes can share the same file: when saving, new entries are
+    merged with the ones on disk and the file is replaced atomically. The
+    entries are protected by a lock, so that the table can be used by
+    multiple threads.
+
+    Subclasses define `_VERSION` and the methods `_encode` and `_decode`,
+    which convert the dictionary of entries to and from the object
+    pickled in `path`.
+    """
+    _VERSION = 1
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._entries: Optional[dict] = None
+        self._unsaved = 0
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        if self.path is not None:
+            # reloaded from disk when needed
+            state['_entries'] = None
+            state['_unsaved'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._get_entries())
+
+    def _encode(self, entries: dict) -> dict:
+        """
+        Returns the object stored in `path` for `entries`
+        """
+        raise NotImplementedError
+
+    def _decode(self, stored: dict) -> dict:
+        """
+        Returns the entries contained in the object `stored` in `path`
+        """
+        raise NotImplementedError
+
+    def _read(self) -> dict:
+        """
+        Returns the entries stored in `path`
+        """
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'rb') as f:
+                stored = pickle.load(f)
+            if stored['version'] != self._VERSION:
+                return {}
+            return self._decode(stored)
+        except Exception:
+            # missing, outdated or corrupted table
+            return {}
+
+    def _get_entries(self) -> dict:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def save(self):
+        """
+        Writes the new entries to `path`
+        """
+        with self._lock:
+            if self.path is None or self._unsaved == 0:
+                return
+            entries = self._read()
+            entries.update(self._get_entries())
+            self._entries = entries
+            stored = self._encode(entries)
+            stored['version'] = self._VERSION
+            tmp = '{}.{}-{}.tmp'.format(self.path, os.getpid(),
+                                        threading.get_ident())
+            try:
+                with open(tmp, 'wb') as f:
+                    pickle.dump(stored, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self.path)
+            except OSError:
+                # the directory is not writable; the table stays in memory
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return
+            self._unsaved = 0
+
+    def clear(self):
+        """
+        Removes all the entries, also from `path`
+        """
+        with self._lock:
+            self._entries = {}
+            self._unsaved = 0
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class AudioMetadata(PersistentTable):
+    """
+    A table of the metadata of audio files (duration in seconds, bitrate in
+    kb/s, sample rate and number of channels, as returned by the last
+    values of ``essentia.standard.MetadataReader``), stored in the file
+    `path` (see `PersistentTable`).
+
+    Files are probed only when they are not in the table or when their
+    modification time or size changed, so that each file is probed once
+    across sessions. New entries are written to `path` every `autosave`
+    probes, by `save` and at exit.
+    """
+    _VERSION = 1
+    _DTYPE = np.dtype([('mtime', np.int64), ('size', np.int64),
+                       ('duration', np.float64), ('bitrate', np.int32),
+                       ('sample_rate', np.int32), ('channels', np.int16)])
+
+    def __init__(self, path: Optional[str] = None, autosave: int = 256):
+        super().__init__(path)
+        self.autosave = autosave
+        _audio_metadata_tables.add(self)
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        _audio_metadata_tables.add(self)
+
+    def _encode(self, entries: dict) -> dict:
+        names = list(entries.keys())
+        return {
+            'names': names,
+            'table': np.array([entries[name] for name in names],
+                              dtype=self._DTYPE)
+        }
+
+    def _decode(self, stored: dict) -> dict:
+        return {
+            name: tuple(row.item())
+            for name, row in zip(stored['names'], stored['table'])
+        }
+
+    def get(self, audio_fn: Union[str, pathlib.Path]) -> Tuple:
+        """
+        Returns duration, bitrate, sample rate and number of channels of
+        `audio_fn`, probing the file if needed
+        """
+        audio_fn = str(audio_fn)
+        stat = os.stat(audio_fn)
+        with self._lock:
+            entry = self._get_entries().get(audio_fn)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns,
+                                                   stat.st_size):
+                return entry[2:]
+
+        reader = MetadataReader(filename=audio_fn, filterMetadata=True)
+        duration, bitrate, sample_rate, channels = reader()[-4:]
+        entry = (stat.st_mtime_ns, stat.st_size, float(duration),
+                 int(bitrate), int(sample_rate), int(channels))
+        with self._lock:
+            self._get_entries()[audio_fn] = entry
+            self._unsaved += 1
+            if self._unsaved >= self.autosave:
+                self.save()
+        return entry[2:]
+
+    def scan(self, filenames, n_threads: int = 8):
+        """
+        Probes the files in `filenames` which are not up-to-date in the table,
+        using `n_threads` threads, and saves the table
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        autosave = self.autosave
+        self.autosave = float('inf')
+        try:
+            with ThreadPoolExecutor(n_threads) as executor:
+                list(executor.map(self.get, filenames))
+        finally:
+            self.autosave = autosave
+        self.save()
+
+
+# the tables whose new entries are saved at exit
+_audio_metadata_tables = weakref.WeakSet()
+
+
+@atexit.register
+def _save_audio_metadata_tables():
+    for table in list(_audio_metadata_tables):
+        table.save()
@@ -0,0 +1,130 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from asmd import gt_io
+
+#: the songs of the synthetic installation: dataset name, ensemble and, for
+#: each song, its title, composer, instruments and groups
+DEFINITIONS = [
+    ('Alpha', False, [
+        ('a0', 'Johann Sebastian Bach', ['piano'], ['train']),
+        ('a1', 'Wolfgang Amadeus Mozart', ['piano'], ['test']),
+        ('a2', 'Johann Sebastian Bach', ['piano'], ['train', 'extra']),
+        ('a3', 'Ludwig van Beethoven', ['piano'], ['test', 'extra']),
+    ]),
+    ('Beta', True, [
+        ('b0', 'Johann Sebastian Bach', ['violin', 'cello'], ['all']),
+        ('b1', 'Antonio Vivaldi', ['violin', 'cello'], ['all']),
+        ('b2', 'Johann Sebastian Bach', ['flute', 'cello'], ['all']),
+    ]),
+]
+
+SCORE_TYPES = ['precise_alignment', 'broad_alignment', 'misaligned', 'score']
+
+
+def make_gt(rng, n_notes, f0=True):
+    """
+    Returns a random ground-truth with `n_notes` notes in each score type
+    """
+    gt = {}
+    for score_type in SCORE_TYPES:
+        onsets = np.sort(rng.uniform(0, 5, n_notes))
+        gt[score_type] = {
+            'onsets': onsets.tolist(),
+            'offsets': (onsets + rng.uniform(0.1, 1, n_notes)).tolist(),
+            'pitches': rng.integers(21, 109, n_notes).tolist(),
+            'velocities': rng.integers(0, 128, n_notes).tolist(),
+            'notes': []
+        }
+    for pedal in ['sustain', 'sostenuto', 'soft']:
+        gt[pedal] = {
+            'times': np.sort(rng.uniform(0, 5, 3)).tolist(),
+            'values': rng.integers(0, 128, 3).tolist()
+        }
+    gt['f0'] = rng.uniform(50, 1000, 20).tolist() if f0 else []
+    gt['instrument'] = 0
+    gt['missing'] = [False] * n_notes
+    gt['extra'] = [False] * n_notes
+    return gt
+
+
+@pytest.fixture
+def install(tmp_path):
+    """
+    Creates a small installation with definitions and ground-truths (no
+    audio) and returns the paths of the definitions directory and of the
+    metadataset file
+    """
+    rng = np.random.default_rng(1992)
+    definitions_dir = tmp_path / 'definitions'
+    install_dir = tmp_path / 'install'
+    definitions_dir.mkdir()
+    for name, ensemble, songs in DEFINITIONS:
+        (install_dir / name).mkdir(parents=True)
+        definition = {
+            'name': name,
+            'ensemble': ensemble,
+            'instruments': sorted({i for song in songs for i in song[2]}),
+            'groups': sorted({g for song in songs for g in song[3]}),
+            'ground_truth': {
+                group: {
+                    'precise_alignment': 1 if group != 'test' else 0,
+                    'misaligned': 2
+                }
+                for song in songs for group in song[3]
+            },
+            'songs': []
+        }
+        for title, composer, instruments, groups in songs:
+            gts = []
+            for k in range(len(instruments)):
+                gt_fn = name + '/' + title + '-' + str(k) + gt_io.JSON_EXT
+                gt_io.save(make_gt(rng, 10 + k, f0=title != 'a1'),
+                           str(install_dir / gt_fn))
+                gts.append(gt_fn)
+            song = {
+                'title': title,
+                'composer': composer,
+                'instruments': instruments,
+                'groups': groups,
+                'recording': {
+                    'path': [name + '/' + title + '.wav']
+                },
+                'ground_truth': gts
+            }
+            if ensemble:
+                song['sources'] = {
+                    'path': [
+                        name + '/' + title + '-' + str(k) + '.wav'
+                        for k in range(len(instruments))
+                    ]
+                }
+            definition['songs'].append(song)
+        with open(definitions_dir / (name + '.json'), 'w') as f:
+            json.dump(definition, f)
+
+    metadataset = tmp_path / 'datasets.json'
+    with open(metadataset, 'w') as f:
+        json.dump({'install_dir': str(install_dir)}, f)
+    return str(definitions_dir), str(metadataset)
+
+
+@pytest.fixture
+def dataset(install, tmp_path, monkeypatch):
+    """
+    A `Dataset` of the installation created by `install`, storing its indexes
+    in a temporary directory
+    """
+    pytest.importorskip('essentia')
+    from asmd import asmd
+    index_dir = tmp_path / 'indexes'
+    index_dir.mkdir()
+    for name in [
+            'DEFINITIONS_INDEX_DIR', 'AUDIO_METADATA_DIR', 'SUMMARY_INDEX_DIR'
+    ]:
+        monkeypatch.setattr(asmd, name, str(index_dir))
+    definitions_dir, metadataset = install
+    return asmd.Dataset([definitions_dir], metadataset_path=metadataset)
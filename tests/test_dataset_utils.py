@@ -0,0 +1,214 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('essentia')
+
+from asmd import asmd  # noqa: E402
+from asmd import dataset_utils, gt_io  # noqa: E402
+
+from conftest import make_gt  # noqa: E402
+
+# each case is a list of keyword arguments of successive calls to `filter`
+FILTERS = [
+    [{}],
+    [{'datasets': ['alpha']}],
+    [{'datasets': ['BETA', 'gamma']}],
+    [{'ensemble': True}],
+    [{'ensemble': False}],
+    [{'instruments': ['violin', 'cello']}],
+    [{'instruments': ['cello', 'violin']}],
+    [{'composer': 'Bach'}],
+    [{'composer': 'Bach'}, {'groups': ['all']}],
+    [{'groups': ['train']}],
+    [{'groups': ['test', 'extra']}],
+    [{'ground_truth': {'precise_alignment': 1}}],
+    [{'ground_truth': [('misaligned', 2)]}],
+    [{'ground_truth': ['precise_alignment']}],
+    [{'ground_truth': {'precise_alignment': 0, 'misaligned': 2}}],
+    [{'datasets': ['beta']}, {'composer': 'Vivaldi'}],
+    [{'instruments': ['violin', 'cello'], 'sources': True}],
+    [{'ensemble': True, 'sources': True, 'all': True, 'mixed': False}],
+]
+
+
+def song_matches(definition, song, datasets=[], ensemble=None,
+                 instruments=[], composer='', groups=[], ground_truth=[],
+                 **kwargs):
+    """
+    Tells whether `song` of the dataset `definition` is selected by `filter`
+    with the given arguments, checking them one song at a time
+    """
+    if datasets and definition['name'].lower() not in [
+            d.lower() for d in datasets
+    ]:
+        return False
+    if ensemble is not None and ensemble != definition['ensemble']:
+        return False
+    if instruments and instruments != song['instruments']:
+        return False
+    if composer not in song['composer']:
+        return False
+    if any(group not in song['groups'] for group in groups):
+        return False
+    if ground_truth:
+        if isinstance(ground_truth, dict):
+            ground_truth = list(ground_truth.items())
+        for group in song['groups']:
+            group_gt = definition['ground_truth'][group]
+            if all(
+                    group_gt.get(gt, 0) > 0 if isinstance(gt, str) else
+                    group_gt.get(gt[0]) == gt[1] for gt in ground_truth):
+                break
+        else:
+            return False
+    return True
+
+
+def reference_songs(dataset, cases):
+    """
+    Returns the list of `(definition, song)` selected by all the `cases`
+    """
+    return [(definition, song) for definition in dataset.datasets
+            for song in definition['songs']
+            if all(song_matches(definition, song, **kwargs)
+                   for kwargs in cases)]
+
+
+def reference_paths(songs, mixed=True, sources=False, all=False,
+                    instruments=[], **kwargs):
+    out = []
+    for definition, song in songs:
+        gts = song['ground_truth']
+        source = []
+        if sources and 'sources' in song:
+            if all:
+                source = song['sources']['path']
+            else:
+                idx = song['instruments'].index(instruments[0])
+                source = song['sources']['path'][idx]
+                gts = song['ground_truth'][idx]
+        out.append([song['recording']['path'] if mixed else [], source, gts])
+    return out
+
+
+def filtered(dataset, cases):
+    out = dataset.view()
+    for kwargs in cases:
+        dataset_utils.filter(out, **kwargs)
+    return out
+
+
+@pytest.mark.parametrize('cases', FILTERS)
+def test_filter(dataset, cases):
+    songs = reference_songs(dataset, cases)
+    out = filtered(dataset, cases)
+    assert out.paths == reference_paths(songs, **cases[-1])
+    assert out.get_songs() == [song for _, song in songs]
+    assert len(dataset.paths) == 7
+
+    copied = dataset_utils.filter(dataset, copy=True, **cases[0])
+    assert copied.paths == reference_paths(reference_songs(dataset,
+                                                           cases[:1]),
+                                           **cases[0])
+    assert len(dataset.paths) == 7
+
+
+@pytest.mark.parametrize('first, second', [(0, 1), (1, 3), (7, 9), (9, 11),
+                                           (2, 2), (4, 5)])
+def test_set_operations(dataset, first, second):
+    songs1 = reference_songs(dataset, FILTERS[first])
+    songs2 = reference_songs(dataset, FILTERS[second])
+    d1 = filtered(dataset, FILTERS[first])
+    d2 = filtered(dataset, FILTERS[second])
+    all_songs = reference_songs(dataset, [{}])
+
+    def select(predicate):
+        return reference_paths(
+            [(d, song) for d, song in all_songs if predicate((d, song))])
+
+    def contains(songs):
+        return lambda entry: any(entry[1] is song for _, song in songs)
+
+    in1, in2 = contains(songs1), contains(songs2)
+    assert dataset_utils.union(d1, d2).paths == select(
+        lambda e: in1(e) or in2(e))
+    assert dataset_utils.intersect(d1, d2).paths == select(
+        lambda e: in1(e) and in2(e))
+    assert dataset_utils.complement(d1).paths == select(lambda e: not in1(e))
+    assert dataset_utils.complement(d1, sources=True, all=True).paths == \
+        reference_paths([e for e in all_songs if not in1(e)], sources=True,
+                        all=True)
+    # the inputs are left untouched
+    assert d1.paths == reference_paths(songs1, **FILTERS[first][-1])
+    assert d2.paths == reference_paths(songs2, **FILTERS[second][-1])
+
+
+def convert(dataset):
+    for i in range(len(dataset)):
+        for gt_fn in dataset.get_gts_paths(i):
+            gt_io.convert_file(os.path.join(dataset.install_dir, gt_fn),
+                               remove_source=True)
+
+
+def count_computed(monkeypatch):
+    """
+    Records the number of songs of each call to `Dataset.parallel`
+    """
+    calls = []
+    parallel = asmd.Dataset.parallel
+
+    def counting(self, *args, **kwargs):
+        calls.append(len(self))
+        return parallel(self, *args, **kwargs)
+
+    monkeypatch.setattr(asmd.Dataset, 'parallel', counting)
+    return calls
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_summary_index(dataset, install, monkeypatch, binary):
+    if binary:
+        convert(dataset)
+    calls = count_computed(monkeypatch)
+    summary = dataset.get_summary(n_jobs=1)
+    assert calls == [7]
+    titles = [song['title'] for song in dataset.get_songs()]
+    n_notes = dict(zip(titles, summary['n_notes']))
+    assert n_notes == {
+        'b0': 21, 'b1': 21, 'b2': 21, 'a0': 10, 'a1': 10, 'a2': 10, 'a3': 10
+    }
+    assert list(summary['has_f0']) == [title != 'a1' for title in titles]
+    assert list(summary['n_sources']) == [2, 2, 2, 1, 1, 1, 1]
+    assert summary['pitch_min'].min() >= 21
+    assert summary['pitch_max'].max() <= 108
+
+    # up-to-date entries are read from disk by a new instance
+    definitions_dir, metadataset = install
+    other = asmd.Dataset([definitions_dir], metadataset_path=metadataset)
+    other_summary = other.get_summary(n_jobs=1)
+    assert calls == [7]
+    np.testing.assert_array_equal(other_summary.table, summary.table)
+
+    # a ground-truth file is written again
+    idx = titles.index('a2')
+    gt_fn = os.path.join(dataset.install_dir, dataset.get_gts_paths(idx)[0])
+    path = gt_io.resolve(gt_fn)
+    mtime = os.stat(path).st_mtime_ns
+    gt_io.save(make_gt(np.random.default_rng(0), 3, f0=False), path)
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+    other = asmd.Dataset([definitions_dir], metadataset_path=metadataset)
+    new_summary = other.get_summary(n_jobs=1)
+    assert calls == [7, 1]
+    assert new_summary['n_notes'][idx] == 3
+    assert not new_summary['has_f0'][idx]
+    unchanged = np.arange(len(titles)) != idx
+    np.testing.assert_array_equal(new_summary.table[unchanged],
+                                  summary.table[unchanged])
+
+    # the summary of filtered datasets is taken from the same index
+    alpha = dataset_utils.filter(other, datasets=['alpha'], copy=True)
+    assert list(alpha.get_summary(n_jobs=1)['n_notes']) == [10, 10, 3, 10]
+    assert calls == [7, 1]
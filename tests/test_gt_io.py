@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+import pytest
+
+from asmd import gt_io
+
+from conftest import make_gt
+
+CODECS = [
+    'gtb', 'json', 'json.gz', 'json.zst', 'json.lz4', 'msgpack', 'msgpack.gz',
+    'msgpack.zst', 'msgpack.lz4'
+]
+
+FIELDS = ['score/onsets', 'precise_alignment', 'sustain/values', 'f0',
+          'missing', 'not_a_field']
+
+
+def assert_same_gt(loaded, expected):
+    """
+    Checks that two ground-truths have the same keys and values, whatever
+    the type (list or array) of the values
+    """
+    assert set(loaded.keys()) == set(expected.keys())
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert_same_gt(loaded[key], value)
+        else:
+            np.testing.assert_array_equal(np.asarray(loaded[key]),
+                                          np.asarray(value),
+                                          err_msg=key)
+
+
+def save_or_skip(gt, path):
+    try:
+        gt_io.save(gt, path)
+    except ImportError as e:
+        pytest.skip(str(e))
+
+
+@pytest.fixture
+def gt():
+    return make_gt(np.random.default_rng(8), 50)
+
+
+@pytest.fixture
+def gt_fn(tmp_path):
+    return str(tmp_path / ('song' + gt_io.JSON_EXT))
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip(gt, gt_fn, codec):
+    path = gt_io.codec_path(gt_fn, codec)
+    save_or_skip(gt, path)
+    assert gt_io.resolve(gt_fn) == path
+    assert_same_gt(gt_io.load(gt_fn), gt)
+    assert_same_gt(gt_io.load(path), gt)
+    # times keep full precision
+    assert gt_io.load(gt_fn)['score']['onsets'][3] == gt['score']['onsets'][3]
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_project(gt, gt_fn, codec):
+    path = gt_io.codec_path(gt_fn, codec)
+    save_or_skip(gt, path)
+    expected = gt_io.project(gt, FIELDS)
+    assert set(expected.keys()) == {
+        'score', 'precise_alignment', 'sustain', 'f0', 'missing'
+    }
+    assert set(expected['score'].keys()) == {'onsets'}
+    assert_same_gt(gt_io.load(gt_fn, FIELDS), expected)
+
+
+def test_load_binary_mmap(gt, gt_fn):
+    path = gt_io.binary_path(gt_fn)
+    gt_io.save(gt, path)
+    assert_same_gt(gt_io.load_binary(path, mmap=True), gt)
+    assert_same_gt(gt_io.load_binary(path, mmap=True, fields=FIELDS),
+                   gt_io.project(gt, FIELDS))
+
+
+def test_resolve_stale_binary(gt, gt_fn):
+    binary = gt_io.binary_path(gt_fn)
+    gt_io.save(gt, gt_fn)
+    assert gt_io.resolve(gt_fn) == gt_fn
+    gt_io.save(gt, binary)
+    assert gt_io.resolve(gt_fn) == binary
+
+    # the json is written again after the conversion
+    new_gt = make_gt(np.random.default_rng(9), 5)
+    gt_io.save(new_gt, gt_fn)
+    mtime = os.stat(binary).st_mtime_ns
+    os.utime(gt_fn, ns=(mtime + 10**9, mtime + 10**9))
+    assert gt_io.resolve(gt_fn) == gt_fn
+    assert_same_gt(gt_io.load(gt_fn), new_gt)
+
+
+def test_remove_other_formats(gt, gt_fn):
+    binary = gt_io.binary_path(gt_fn)
+    gt_io.save(gt, gt_fn)
+    gt_io.save(gt, binary)
+    gt_io.save(gt, gt_io.codec_path(gt_fn, 'json'))
+    new_gt = make_gt(np.random.default_rng(9), 5)
+    gt_io.save(new_gt, gt_fn)
+    gt_io.remove_other_formats(gt_fn)
+    assert os.listdir(os.path.dirname(gt_fn)) == [os.path.basename(gt_fn)]
+    assert_same_gt(gt_io.load(gt_fn), new_gt)
+
+
+def test_convert_file(gt, gt_fn):
+    gt_io.save(gt, gt_fn)
+    path = gt_io.convert_file(gt_fn, remove_source=True)
+    assert path == gt_io.binary_path(gt_fn)
+    assert not os.path.exists(gt_fn)
+    assert_same_gt(gt_io.load(gt_fn), gt)
+
+
+def test_field_lengths(gt, gt_fn):
+    gt_io.save(gt, gt_fn)
+    assert gt_io.field_lengths(gt_fn) is None
+    gt_io.save(gt, gt_io.binary_path(gt_fn))
+    lengths = gt_io.field_lengths(gt_fn)
+    assert lengths['score/onsets'] == 50
+    assert lengths['sustain/times'] == 3
+    assert lengths['f0'] == 20
+    assert lengths['instrument'] == 1
@@ -0,0 +1,200 @@
+import io
+import os
+import pathlib
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+pytest.importorskip('essentia')
+
+from asmd import utils  # noqa: E402
+
+
+def random_notes(rng, n, long_notes=0):
+    onsets = rng.uniform(0, 100, n)
+    durations = rng.exponential(0.3, n)
+    durations[:long_notes] = rng.uniform(50, 100, long_notes)
+    notes = np.zeros((n, 5))
+    notes[:, 0] = rng.integers(21, 109, n)
+    notes[:, 1] = onsets
+    notes[:, 2] = onsets + durations
+    return notes
+
+
+def brute_force(notes, t0, t1, side='left'):
+    starting = notes[:, 1] <= t1 if side == 'right' else notes[:, 1] < t1
+    out = notes[starting & (notes[:, 2] > t0)]
+    return out[np.argsort(out[:, 1], kind='stable')]
+
+
+@pytest.mark.parametrize('long_notes', [0, 1, 20])
+def test_note_index(long_notes):
+    rng = np.random.default_rng(long_notes)
+    notes = random_notes(rng, 2000, long_notes)
+    # notes with the same onset and zero duration
+    notes[10:20, 1:3] = notes[10, 1]
+    index = utils.NoteIndex(notes)
+    assert len(index) == len(notes)
+
+    windows = np.sort(rng.uniform(-5, 105, (200, 2)), axis=1)
+    windows[:20, 1] = windows[:20, 0]
+    for (t0, t1), found in zip(windows, index.between_many(windows)):
+        expected = brute_force(notes, t0, t1)
+        np.testing.assert_array_equal(index.between(t0, t1), expected)
+        np.testing.assert_array_equal(found, expected)
+        np.testing.assert_array_equal(index.active_at(t0),
+                                      brute_force(notes, t0, t0, 'right'))
+    assert index.between_many(np.zeros((0, 2))) == []
+
+
+def test_empty_note_index():
+    index = utils.NoteIndex(np.zeros((0, 5)))
+    assert index.between(0, 1).shape == (0, 5)
+    assert [w.shape for w in index.between_many([[0, 1], [1, 2]])] == [
+        (0, 5), (0, 5)
+    ]
+
+
+def disk_size(cache):
+    return sum(
+        os.path.getsize(os.path.join(cache.path, fn))
+        for fn in os.listdir(cache.path) if fn.endswith('.npy'))
+
+
+def test_disk_cache_size(tmp_path):
+    value = np.zeros(1000)
+    f = io.BytesIO()
+    np.save(f, value)
+    file_size = len(f.getvalue())
+    cache = utils.DiskCache(str(tmp_path / 'cache'), 10 * file_size)
+    for i in range(35):
+        cache.put(('song', i), value + i)
+        assert disk_size(cache) <= cache.max_bytes
+        assert cache._nbytes == disk_size(cache)
+
+    # the most recent values are kept
+    np.testing.assert_array_equal(cache.get(('song', 34)), value + 34)
+    assert cache.get(('song', 0)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # replacing a value does not change the size
+    before = cache._nbytes
+    cache.put(('song', 34), value - 1)
+    assert cache._nbytes == before == disk_size(cache)
+    np.testing.assert_array_equal(cache.get(('song', 34)), value - 1)
+
+    # too large values are not stored
+    cache.put('large', np.zeros(100000))
+    assert cache.get('large') is None
+    assert cache._nbytes == disk_size(cache)
+
+
+def test_disk_cache_lru(tmp_path):
+    cache = utils.DiskCache(str(tmp_path), 10**6)
+    for i in range(3):
+        cache.put(i, np.full(100, i))
+        os.utime(cache.filename(i), ns=(i * 10**9, i * 10**9))
+    # key 0 is used, so key 1 is the least recently used
+    cache.get(0)
+    size = utils._file_size(cache.filename(0))
+    cache.evict(2 * size)
+    assert cache.get(1) is None
+    np.testing.assert_array_equal(cache.get(0), np.full(100, 0))
+    np.testing.assert_array_equal(cache.get(2, mmap=True), np.full(100, 2))
+
+
+def test_disk_cache_stale_entries(tmp_path):
+    cache = utils.DiskCache(str(tmp_path), 10**6)
+    for i in range(3):
+        cache.put(i, np.full(100, i))
+    cache.invalidate(0)
+    assert cache.get(0, 'missing') == 'missing'
+    assert cache._nbytes == disk_size(cache)
+    cache.invalidate(0)
+    assert cache._nbytes == disk_size(cache)
+
+    # entries written or removed by another process
+    other = utils.DiskCache(str(tmp_path), 10**6)
+    np.testing.assert_array_equal(other.get(1), np.full(100, 1))
+    other.put(3, np.full(100, 3))
+    os.remove(other.filename(2))
+    assert cache.get(2) is None
+    np.testing.assert_array_equal(cache.get(3), np.full(100, 3))
+    cache.evict()
+    assert cache._nbytes == disk_size(cache)
+
+    # a corrupted file is a miss
+    with open(cache.filename(1), 'wb') as f:
+        f.write(b'not an array')
+    assert cache.get(1) is None
+
+    cache.clear()
+    assert disk_size(cache) == 0 and cache._nbytes == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+class CountingReader(object):
+    """
+    Replaces ``MetadataReader``, reading the wav files with scipy and
+    counting the probed files
+    """
+    calls = []
+
+    def __init__(self, filename, **kwargs):
+        self.filename = filename
+
+    def __call__(self):
+        CountingReader.calls.append(self.filename)
+        sr, data = wavfile.read(self.filename)
+        channels = 1 if data.ndim == 1 else data.shape[1]
+        return (None, len(data) / sr, 16 * sr * channels // 1000, sr,
+                channels)
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    CountingReader.calls = []
+    monkeypatch.setattr(utils, 'MetadataReader', CountingReader)
+    return CountingReader
+
+
+def test_audio_metadata(tmp_path, reader):
+    audio_fn = str(tmp_path / 'song.wav')
+    wavfile.write(audio_fn, 8000, np.zeros(8000, dtype=np.int16))
+    table_fn = str(tmp_path / 'metadata.pkl')
+    table = utils.AudioMetadata(table_fn)
+    assert table.get(audio_fn) == (1.0, 128, 8000, 1)
+    assert table.get(pathlib.Path(audio_fn)) == (1.0, 128, 8000, 1)
+    assert len(reader.calls) == 1
+    table.save()
+
+    # up-to-date entries are read from disk by a new instance
+    table = utils.AudioMetadata(table_fn)
+    assert table.get(audio_fn) == (1.0, 128, 8000, 1)
+    assert len(reader.calls) == 1
+
+    # the file is written again
+    mtime = os.stat(audio_fn).st_mtime_ns
+    wavfile.write(audio_fn, 8000, np.zeros((16000, 2), dtype=np.int16))
+    os.utime(audio_fn, ns=(mtime + 10**9, mtime + 10**9))
+    assert table.get(audio_fn) == (2.0, 256, 8000, 2)
+    assert len(reader.calls) == 2
+    table.save()
+    assert utils.AudioMetadata(table_fn).get(audio_fn) == (2.0, 256, 8000, 2)
+    assert len(reader.calls) == 2
+
+
+def test_audio_metadata_scan(tmp_path, reader):
+    filenames = []
+    for i in range(1, 6):
+        filenames.append(str(tmp_path / '{}.wav'.format(i)))
+        wavfile.write(filenames[-1], 8000, np.zeros(8000 * i,
+                                                    dtype=np.int16))
+    table_fn = str(tmp_path / 'metadata.pkl')
+    utils.AudioMetadata(table_fn).scan(filenames, n_threads=2)
+    assert sorted(reader.calls) == sorted(filenames)
+    table = utils.AudioMetadata(table_fn)
+    assert len(table) == 5
+    assert [table.get(fn)[0] for fn in filenames] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert len(reader.calls) == 5